@@ -1,17 +1,535 @@
 # Om Sri Sai Ram
 
+from array import array
+from collections.abc import MutableMapping, MutableSet
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+class StateBudgetExceeded(RuntimeError):
+    """raised when a construction would create more states than the budget it was given"""
+
+def iter_bits(m: int):
+    # indices of the set bits of m in increasing order, in time linear in the size of m
+    for c, b in enumerate(m.to_bytes((m.bit_length() + 7) // 8, 'little')):
+        while b:
+            low = b & -b
+            yield 8 * c + low.bit_length() - 1
+            b ^= low
+
+def bits_to_int(indices: list, n: int) -> int:
+    # the int with exactly the given bits set (each < n); large sets go through a bytearray instead of n-bit shifts
+    if len(indices) <= 64:
+        m = 0
+        for i in indices:
+            m |= 1 << i
+        return m
+    buf = bytearray((n + 7) // 8)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+# Core storage. States and symbols are interned to dense ids in a labels table, once per automaton; Q and F are
+# bitsets over the state ids and delta keeps its transitions in int buffers indexed by ids. All three still look
+# like the set and the dict {(q, a): ...} they replace, so labels go in and come out everywhere. Each of them counts
+# its edits in version, which is what automaton.version adds up.
+
+class labels:
+    """bidirectional table between labels and the dense ids 0, 1, 2, ... they are interned to"""
+    __slots__ = ('items', 'ids')
+
+    def __init__(self, items=()) -> None:
+        self.items = []
+        self.ids = {}
+        for x in items: self.intern(x)
+
+    def intern(self, x) -> int:
+        i = self.ids.get(x)
+        if i is None:
+            i = self.ids[x] = len(self.items)
+            self.items.append(x)
+        return i
+
+    def release(self, x):
+        # forget x; its id is not handed out again, so ids held elsewhere never come to mean another label
+        self.items[self.ids.pop(x)] = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i: int):
+        return self.items[i]
+
+class state_set(MutableSet):
+    """set of labels of a labels table, kept as a bitset over their ids"""
+    __slots__ = ('table', 'bits', 'count', 'version')
+
+    def __init__(self, table: labels, items=()) -> None:
+        self.table = table
+        self.bits = bytearray()
+        self.count = 0
+        self.version = 0
+        for x in items: self.add(x)
+
+    @classmethod
+    def _from_iterable(cls, it):
+        # results of &, |, - are plain sets, as they were before
+        return set(it)
+
+    def copy(self) -> 'state_set':
+        # the same labels over the same table, so the version carries over too
+        S = state_set(self.table)
+        S.bits = bytearray(self.bits)
+        S.count = self.count
+        S.version = self.version
+        return S
+
+    def __contains__(self, x):
+        i = self.table.ids.get(x, -1)
+        return i >= 0 and (i >> 3) < len(self.bits) and (self.bits[i >> 3] >> (i & 7)) & 1 == 1
+
+    def __iter__(self):
+        items = self.table.items
+        # over a copy of the bits, so the set can be edited while it is iterated
+        for c, b in enumerate(bytes(self.bits)):
+            while b:
+                low = b & -b
+                yield items[8 * c + low.bit_length() - 1]
+                b ^= low
+
+    def __len__(self):
+        return self.count
+
+    def add(self, x):
+        i = self.table.intern(x)
+        if (i >> 3) >= len(self.bits):
+            self.bits.extend(bytes(max((i >> 3) + 1 - len(self.bits), len(self.bits))))
+        if not (self.bits[i >> 3] >> (i & 7)) & 1:
+            self.bits[i >> 3] |= 1 << (i & 7)
+            self.count += 1
+            self.version += 1
+
+    def discard(self, x):
+        if x not in self: return
+        i = self.table.ids[x]
+        self.bits[i >> 3] &= ~(1 << (i & 7))
+        self.count -= 1
+        self.version += 1
+
+    def mask(self) -> int:
+        """the ids of the set as an int bitmask"""
+        return int.from_bytes(self.bits, 'little')
+
+    def issubset(self, other):
+        return all(x in other for x in self)
+
+    def union(self, *others):
+        return set(self).union(*others)
+
+    def intersection(self, *others):
+        return set(self).intersection(*others)
+
+    def difference(self, *others):
+        return set(self).difference(*others)
+
+    def __repr__(self):
+        return '{' + ', '.join(map(repr, self)) + '}' if self.count else 'set()'
+
+class dfa_delta(MutableMapping):
+    """transitions of a dfa: one array('i') row per symbol id, indexed by state id, holding the id of the successor
+    or -1 where there is none. Reads and writes as the dict {(q, a): q2}."""
+    __slots__ = ('states', 'symbols', 'rows', 'count', 'version')
+
+    def __init__(self, states: labels, symbols: labels) -> None:
+        self.states = states
+        self.symbols = symbols
+        self.rows = []
+        self.count = 0
+        self.version = 0
+
+    def _find(self, key) -> tuple:
+        # (row, state id) of key, with the row None if the symbol was never seen
+        q, a = key
+        s = self.states.ids.get(q, -1)
+        b = self.symbols.ids.get(a, -1)
+        if s < 0 or b < 0 or b >= len(self.rows): return None, s
+        return self.rows[b], s
+
+    def __getitem__(self, key):
+        row, s = self._find(key)
+        if row is None or s >= len(row) or row[s] < 0: raise KeyError(key)
+        return self.states.items[row[s]]
+
+    def __contains__(self, key):
+        row, s = self._find(key)
+        return row is not None and s < len(row) and row[s] >= 0
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, q2):
+        q, a = key
+        if q2 is None:
+            # None is what a missing transition looks like, so it is stored as one
+            self.pop(key, None)
+            return
+        s = self.states.intern(q)
+        b = self.symbols.intern(a)
+        t = self.states.intern(q2)
+        while b >= len(self.rows): self.rows.append(array('i'))
+        row = self.rows[b]
+        if s >= len(row):
+            row.extend(array('i', [-1]) * max(s + 1 - len(row), len(row)))
+        if row[s] < 0: self.count += 1
+        row[s] = t
+        self.version += 1
+
+    def __delitem__(self, key):
+        row, s = self._find(key)
+        if row is None or s >= len(row) or row[s] < 0: raise KeyError(key)
+        row[s] = -1
+        self.count -= 1
+        self.version += 1
+
+    def set_row(self, a, ids):
+        """replace the transitions on a by ids, the successor id of every state id in order (-1 for none), as any
+        buffer of C ints (e.g. an int32 numpy array): one copy, with no per-transition work"""
+        b = self.symbols.intern(a)
+        while b >= len(self.rows): self.rows.append(array('i'))
+        row = array('i')
+        row.frombytes(memoryview(ids).cast('B'))
+        self.count += len(row) - row.count(-1) - len(self.rows[b]) + self.rows[b].count(-1)
+        self.rows[b] = row
+        self.version += 1
+
+    def expand(self):
+        """compute the transitions that are not stored yet; here all of them are (see nfa.subset_delta, whose are
+        computed on demand). Whatever reads Q and delta as a whole calls this first."""
+        return self
+
+    def walk(self, s: int, word) -> int:
+        """id of the state reached from state id s by reading word, or -1 where a transition is missing"""
+        ids, rows = self.symbols.ids, self.rows
+        for a in word:
+            b = ids.get(a, -1)
+            if b < 0 or b >= len(rows): return -1
+            row = rows[b]
+            if s >= len(row): return -1
+            s = row[s]
+            if s < 0: return -1
+        return s
+
+    def drop(self, ids: set):
+        """remove every transition from or into the state ids, in one pass"""
+        self.version += 1
+        for row in self.rows:
+            for s, t in enumerate(row):
+                if t >= 0 and (s in ids or t in ids):
+                    row[s] = -1
+                    self.count -= 1
+
+    def edges(self):
+        """the transitions as (state id, symbol id, successor id)"""
+        for b, row in enumerate(self.rows):
+            for s, t in enumerate(row):
+                if t >= 0: yield s, b, t
+
+    def __iter__(self):
+        states, symbols = self.states.items, self.symbols.items
+        for s, b, _ in self.edges():
+            yield states[s], symbols[b]
+
+    def items(self):
+        states, symbols = self.states.items, self.symbols.items
+        return [((states[s], symbols[b]), states[t]) for s, b, t in self.edges()]
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.rows = []
+        self.count = 0
+        self.version += 1
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class nfa_delta(MutableMapping):
+    """transitions of an nfa: one dict per symbol id from state id to the tuple of successor ids. Reads and writes as
+    the dict {(q, a): set of successors}; the sets it returns are frozensets, so that an edit meant for delta (such as
+    M.delta[(q, a)].add(q2)) raises instead of changing a copy: edit through add and discard, or assign."""
+    __slots__ = ('states', 'symbols', 'rows', 'count', 'version')
+
+    def __init__(self, states: labels, symbols: labels) -> None:
+        self.states = states
+        self.symbols = symbols
+        self.rows = []
+        self.count = 0
+        self.version = 0
+
+    def _find(self, key) -> tuple:
+        # (tuple of successor ids or None, state id) of key
+        q, a = key
+        s = self.states.ids.get(q, -1)
+        b = self.symbols.ids.get(a, -1)
+        if s < 0 or b < 0 or b >= len(self.rows): return None, s
+        return self.rows[b].get(s), s
+
+    def __getitem__(self, key):
+        ts, _ = self._find(key)
+        if ts is None: raise KeyError(key)
+        items = self.states.items
+        return frozenset(items[t] for t in ts)
+
+    def __contains__(self, key):
+        return self._find(key)[0] is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _row(self, a) -> dict:
+        b = self.symbols.intern(a)
+        while b >= len(self.rows): self.rows.append({})
+        return self.rows[b]
+
+    def __setitem__(self, key, q2s):
+        q, a = key
+        ts = tuple(dict.fromkeys(self.states.intern(q2) for q2 in q2s))
+        row = self._row(a)
+        s = self.states.intern(q)
+        self.version += 1
+        if s in row: self.count -= 1
+        if ts:
+            row[s] = ts
+            self.count += 1
+        else:
+            row.pop(s, None)
+
+    def __delitem__(self, key):
+        ts, s = self._find(key)
+        if ts is None: raise KeyError(key)
+        del self.rows[self.symbols.ids[key[1]]][s]
+        self.count -= 1
+        self.version += 1
+
+    def add(self, q, a, q2):
+        """add q2 to the successors of q on a"""
+        row = self._row(a)
+        s = self.states.intern(q)
+        t = self.states.intern(q2)
+        ts = row.get(s)
+        if ts is None:
+            row[s] = (t,)
+            self.count += 1
+        elif t not in ts:
+            row[s] = ts + (t,)
+        else: return
+        self.version += 1
+
+    def discard(self, q, a, q2):
+        """remove q2 from the successors of q on a, if it is one"""
+        ts, s = self._find((q, a))
+        t = self.states.ids.get(q2, -1)
+        if ts is None or t not in ts: return
+        row = self.rows[self.symbols.ids[a]]
+        if len(ts) == 1:
+            del row[s]
+            self.count -= 1
+        else:
+            row[s] = tuple(x for x in ts if x != t)
+        self.version += 1
+
+    def row(self, a) -> dict:
+        """successor ids of the state ids on a, as {state id: tuple of successor ids}"""
+        b = self.symbols.ids.get(a, -1)
+        return self.rows[b] if 0 <= b < len(self.rows) else {}
+
+    def image(self, X, a) -> set:
+        """union of the successors on a of the states in X"""
+        b = self.symbols.ids.get(a, -1)
+        if b < 0 or b >= len(self.rows): return set()
+        row, ids = self.rows[b], self.states.ids
+        Y = set()
+        for q in X:
+            ts = row.get(ids.get(q, -1))
+            if ts is not None: Y.update(ts)
+        items = self.states.items
+        return set(items[t] for t in Y)
+
+    def edges(self):
+        """the transitions as (state id, symbol id, tuple of successor ids)"""
+        for b, row in enumerate(self.rows):
+            for s, ts in row.items():
+                yield s, b, ts
+
+    def __iter__(self):
+        states, symbols = self.states.items, self.symbols.items
+        for s, b, _ in self.edges():
+            yield states[s], symbols[b]
+
+    def items(self):
+        states, symbols = self.states.items, self.symbols.items
+        return [((states[s], symbols[b]), frozenset(states[t] for t in ts)) for s, b, ts in self.edges()]
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.rows = []
+        self.count = 0
+        self.version += 1
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class verdict:
+    """answer of a decision procedure (is_empty, includes, ...): true iff the property holds; when it does not,
+    counterexample is a shortest word showing so"""
+    __slots__ = ('holds', 'counterexample')
+
+    def __init__(self, holds: bool, counterexample: str|None=None) -> None:
+        self.holds = holds
+        self.counterexample = counterexample
+
+    def __bool__(self):
+        return self.holds
+
+    def __repr__(self):
+        return 'verdict(True)' if self.holds else f'verdict(False, {self.counterexample!r})'
+
+# Instrumentation. Operations report counters and timers to profiler.active, the profiler of the innermost
+# `with automaton.profile() as p:` block, and skip all of it when there is none; hot loops (accepts) only ever
+# look at it once per call.
+
+class profiler:
+    """counters and timers of the operations run while it is active, and an optional progress callback
+    progress(op, done) called every `every` units of work of a long construction (raise from it to abort)"""
+    active = None
+
+    def __init__(self, progress=None, every: int=1000) -> None:
+        self.progress = progress
+        self.every = every
+        self.counters = {}
+        self.timers = {}
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = profiler.active
+        profiler.active = self
+        return self
+
+    def __exit__(self, *exc):
+        profiler.active = self.previous
+        return False
+
+    def count(self, key: str, n: int=1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def tick(self, op: str, done: int):
+        if self.progress is not None and done % self.every == 0:
+            self.progress(op, done)
+
+    @contextmanager
+    def timer(self, key: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            t = perf_counter() - start
+            calls, total, longest = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (calls + 1, total + t, max(longest, t))
+
+    def report(self) -> dict:
+        """{'counters': {key: n}, 'timers': {key: {'calls', 'total', 'max'}}, 'rates': {key: hits / (hits + misses)}}"""
+        rates = {}
+        for key, hits in self.counters.items():
+            if key.endswith('.hits'):
+                base = key[:-len('.hits')]
+                misses = self.counters.get(base + '.misses', 0)
+                rates[base] = hits / (hits + misses) if hits + misses else None
+        timers = {key: {'calls': calls, 'total': total, 'max': longest} for key, (calls, total, longest) in self.timers.items()}
+        return {'counters': dict(self.counters), 'timers': timers, 'rates': rates}
+
+def timed(key: str):
+    """the timer key of the active profiler, or a no-op"""
+    p = profiler.active
+    return p.timer(key) if p is not None else nullcontext()
+
 class automaton:
+    # storage class of delta (dfa_delta, nfa_delta); None keeps a plain dict
+    delta_type = None
+
     def __init__(self, Q: set|list|int, A: set|list|int, F: set|list|str, name:str|None=None) -> None:
-        self.Q: set = self._format(Q)
+        self.states = labels()
+        self.symbols = labels()
+        # edits of Q, F and delta made before they were last replaced (see version)
+        self._replaced = 0
+        self.Q = self._format(Q)
         self.A: set = self._format(A)
-        self.F: set = self._format(F)
+        self.F = self._format(F)
         assert self.F.issubset(self.Q), f'F = {self.F} not a subset of Q = {self.Q}'
         self.name = name if name else 'automaton'
         self.delta = {}
 
+    # Q, F and delta are always stored over this automaton's tables; assigning any set or dict converts it
+
+    @property
+    def version(self) -> int:
+        """count of the edits of Q, F and delta so far, including replacing them: compiled tables and caches built
+        at one version are stale at any other"""
+        return self._replaced + self._Q.version + self._F.version + getattr(self._delta, 'version', 0)
+
+    def _replace(self, name: str):
+        # keep version growing when an edited set or delta is swapped for a new one
+        old = getattr(self, name, None)
+        if old is not None: self._replaced += getattr(old, 'version', 0) + 1
+
+    @property
+    def Q(self) -> state_set:
+        return self._Q
+
+    @Q.setter
+    def Q(self, value):
+        self._replace('_Q')
+        # a state_set over the same table is copied too, or Q and F (or two automata) would share it
+        self._Q = value.copy() if isinstance(value, state_set) and value.table is self.states else state_set(self.states, value)
+
+    @property
+    def F(self) -> state_set:
+        return self._F
+
+    @F.setter
+    def F(self, value):
+        self._replace('_F')
+        self._F = value.copy() if isinstance(value, state_set) and value.table is self.states else state_set(self.states, value)
+
+    @property
+    def delta(self):
+        return self._delta
+
+    @delta.setter
+    def delta(self, value):
+        self._replace('_delta')
+        if self.delta_type is None or (isinstance(value, self.delta_type) and value.states is self.states):
+            self._delta = value
+            return
+        self._delta = self.delta_type(self.states, self.symbols)
+        self._delta.update(value.items())
+
     def _format(self, obj: list|str):
-        if isinstance(obj, set):
-            return obj
+        if isinstance(obj, (set, frozenset, state_set)):
+            return set(obj)
         if isinstance(obj, list):
             return set(obj)
         if isinstance(obj, int):
@@ -19,8 +537,26 @@ class automaton:
         assert isinstance(obj, str)
         return set(q for q, bit in zip(self.Q, obj) if bit == '1')
     
+    @staticmethod
+    def profile(progress=None, every: int=1000) -> profiler:
+        """context manager collecting counters and timers of the operations run inside it:
+        with automaton.profile() as p: ...; p.report()"""
+        return profiler(progress, every)
+
     def size(self):
         return len(self.Q)
+
+    # ((id, size) of A, classifier) of the last symbol_classes
+    _classes = None
+
+    def symbol_classes(self):
+        """classifier of the char_class symbols of A (see symbolic.py), or None if there are none; the words read by
+        an automaton over char_classes go through it, character by character"""
+        key = (id(self.A), len(self.A))
+        if self._classes is None or self._classes[0] != key:
+            import symbolic
+            self._classes = (key, symbolic.classifier.of(self.A))
+        return self._classes[1]
     
     def add_edge(self, q1, q2, a):
         pass
@@ -35,13 +571,34 @@ class automaton:
         pass
 
     def clear_edges(self):
-        self.delta = {}
+        self.delta.clear()
         return self
+
+    def save(self, path: str):
+        """write this automaton to path in the binary format of serialize.py"""
+        import serialize
+        serialize.save(self, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool=True):
+        import serialize
+        M = serialize.load(path, mmap)
+        assert isinstance(M, cls), f'{path} holds a {type(M).__name__}, not a {cls.__name__}'
+        return M
     
     def run(self, word: str):
         pass
 
 if __name__ == '__main__':
+    # assigning Q or F from a state_set keeps a state_set of its own, whose edits still count in version
+    M = automaton(['q0', 'q1'], ['0'], ['q1'], name='M')
+    v = M.version
+    M.Q = M.Q
+    M.F = M.Q
+    assert type(M.Q) is state_set and type(M.F) is state_set and M.F is not M.Q
+    M.F.discard('q0')
+    assert 'q0' in M.Q and M.version > v
+
     Q = ['q0', 'q1', 'q2']
     A = ['0', '1']
     Q_0 = ['q0']
@@ -0,0 +1,136 @@
+import random
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dfa import dfa
+from nfa import nfa, eps_nfa
+from cfg import CFG
+from regexp import compile_regex
+
+# Families of automata and grammars with known behaviour, for the benchmarks in run.py. Every generator is
+# deterministic given its seed.
+
+def random_dfa(n: int, A: str='ab', final: float=0.5, seed: int=0) -> dfa:
+    """complete dfa on states 0..n-1 with uniformly random transitions"""
+    rng = random.Random(seed)
+    M = dfa(n, set(A), 0, set(q for q in range(n) if rng.random() < final), name=f'random_dfa_{n}')
+    for q in range(n):
+        for a in A:
+            M.add_edge(q, rng.randrange(n), a)
+    return M
+
+def tree_dfa(n: int, A: str='ab', final: float=0.3, seed: int=0) -> dfa:
+    """dfa on states 0..n-1 shaped as a complete tree: the successors of q are len(A) * q + 1, ..., where below n"""
+    rng = random.Random(seed)
+    M = dfa(n, set(A), 0, set(q for q in range(n) if rng.random() < final), name=f'tree_dfa_{n}')
+    for q in range(n):
+        for i, a in enumerate(A):
+            if len(A) * q + i + 1 < n: M.add_edge(q, len(A) * q + i + 1, a)
+    return M
+
+def random_nfa(n: int, A: str='ab', degree: float=2.0, final: float=0.1, seed: int=0) -> nfa:
+    """nfa on states 0..n-1 with about degree random successors per state and symbol"""
+    rng = random.Random(seed)
+    M = nfa(n, set(A), set([0]), set(q for q in range(n) if rng.random() < final), name=f'random_nfa_{n}')
+    for _ in range(int(degree * n * len(A))):
+        M.add_edge(rng.randrange(n), rng.randrange(n), rng.choice(A))
+    return M
+
+def blowup_nfa(k: int, marker: str='a') -> nfa:
+    """nfa for (a|b)*a(a|b)^k: k+2 states, while its minimal dfa has 2^(k+1) states. Another marker word replaces
+    the a before (a|b)^k, e.g. (a|b)*aa(a|b)^(k-1) (marker 'aa') is a subset of the language for k."""
+    m = len(marker)
+    M = nfa(k + m + 1, set('ab'), set([0]), set([k + m]), name=f'blowup_{marker}_{k}')
+    M.add_edge(0, 0, 'a')
+    M.add_edge(0, 0, 'b')
+    for i, a in enumerate(marker):
+        M.add_edge(i, i + 1, a)
+    for i in range(m, k + m):
+        M.add_edge(i, i + 1, 'a')
+        M.add_edge(i, i + 1, 'b')
+    return M
+
+def unicode_blowup(k: int) -> eps_nfa:
+    """eps_nfa for .*[a-z].{k} over all of Unicode, on the symbolic alphabet {[a-z], not [a-z]}; like blowup_nfa its
+    dfa has 2^(k+1) states"""
+    return compile_regex(f'.*[a-z].{{{k}}}', symbolic=True)
+
+def eps_chain(n: int, cycle: bool=False) -> eps_nfa:
+    """eps-edges 0 -> 1 -> ... -> n-1 (and back to 0 with cycle=True), every state with an a-loop; the closure of 0
+    is all of Q, and with the cycle the whole chain is one strongly connected component"""
+    M = eps_nfa(n, set('a'), set([0]), set([n - 1]), name=f'eps_{"cycle" if cycle else "chain"}_{n}')
+    for i in range(n - 1):
+        M.add_edge(i, i + 1, eps_nfa.eps)
+    if cycle: M.add_edge(n - 1, 0, eps_nfa.eps)
+    for i in range(n):
+        M.add_edge(i, i, 'a')
+    return M
+
+def dyck_cfg() -> CFG:
+    """balanced brackets: S -> (S)S | eps"""
+    G = CFG(set('S'), set('()'), 'S')
+    G.add_production('S', '(S)S')
+    G.add_production('S', 'ϵ')
+    return G
+
+def arithmetic_cfg() -> CFG:
+    """sums and products of a with brackets: E -> E+T | T, T -> T*F | F, F -> (E) | a"""
+    G = CFG(set('ETF'), set('a+*()'), 'E')
+    G.add_production('E', 'E+T')
+    G.add_production('E', 'T')
+    G.add_production('T', 'T*F')
+    G.add_production('T', 'F')
+    G.add_production('F', '(E)')
+    G.add_production('F', 'a')
+    return G
+
+def padded_cfg(k: int, seed: int=0) -> CFG:
+    """arithmetic_cfg with k useless nonterminals and about 3k productions: half of them derive no word (E -> Di,
+    Di -> Di a | (Dj)), the others are unreachable from E (Ui -> Ui + T | a)"""
+    rng = random.Random(seed)
+    G = arithmetic_cfg()
+    for i in range(k):
+        if i % 2 == 0:
+            D = f'D{i}'
+            G.N.add(D)
+            G.add_production('E', (D,))
+            G.add_production(D, (D, 'a'))
+            G.add_production(D, ('(', f'D{rng.randrange(0, k, 2)}', ')'))
+        else:
+            U = f'U{i}'
+            G.N.add(U)
+            G.add_production(U, (U, '+', 'T'))
+            G.add_production(U, ('a',))
+            G.add_production(U, (f'U{rng.randrange(1, k, 2)}', '*', 'F'))
+    return G
+
+def dyck_word(n: int, seed: int=0) -> str:
+    """random balanced word of length 2 * (n // 2)"""
+    rng = random.Random(seed)
+    word, depth, opened = [], 0, 0
+    for i in range(2 * (n // 2)):
+        # open while there are opens left, unless closing is forced or chosen
+        if opened < n // 2 and (depth == 0 or rng.random() < 0.5):
+            word.append('(')
+            depth += 1
+            opened += 1
+        else:
+            word.append(')')
+            depth -= 1
+    return ''.join(word)
+
+def arithmetic_word(n: int, seed: int=0) -> str:
+    """random expression of about n symbols"""
+    rng = random.Random(seed)
+    word = ['a']
+    while len(word) < n:
+        r = rng.random()
+        if r < 0.2 and len(word) + 4 <= n:
+            word = ['('] + word + [')', rng.choice('+*'), 'a']
+        else:
+            word += [rng.choice('+*'), 'a']
+    return ''.join(word)
+
+def random_word(n: int, A: str='ab', seed: int=0) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choice(A) for _ in range(n))
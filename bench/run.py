@@ -0,0 +1,200 @@
+import argparse
+import fnmatch
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import generators as gen
+from regexp import compile_regex
+from search import scanner
+
+# Benchmarks of the constructions over the families in generators.py. Every case times one operation across sizes,
+# records the peak memory of one run with tracemalloc (in a separate run, tracemalloc slows everything down) and
+# fits the scaling exponent: the slope of log(time) against log(size), where the size is the input size or, for the
+# constructions, the number of states built.
+#
+#   python bench/run.py                              run everything, print a table, write bench/results.json
+#   python bench/run.py --quick --only 'to_dfa*'     smaller sizes, only the matching cases
+#   python bench/run.py --save-baseline              also store the results as bench/baseline.json
+#   python bench/run.py --baseline bench/baseline.json --tolerance 1.5
+#                                                    exit with status 1 if any time or peak memory got worse by more
+#                                                    than the tolerance factor than in the baseline
+#
+# bench/baseline.json is a moving snapshot: it is recorded from the current tree and extended with the new cases as
+# features land, so it catches regressions between commits. It does not measure the gain over the code before the
+# suite existed; most cases use operations that code does not have.
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class case:
+    """a benchmark: setup(size) builds the input outside the timing, run(input) is timed; measure(size, output) is the
+    size the exponent is fitted against (e.g. the number of states built, for constructions)"""
+    def __init__(self, name: str, sizes: list, quick: list, setup, run, measure=None) -> None:
+        self.name = name
+        self.sizes = sizes
+        self.quick = quick
+        self.setup = setup
+        self.run = run
+        self.measure = measure if measure else (lambda size, out: size)
+
+def states(size, M):
+    return len(M.Q)
+
+def leaf_edits(n):
+    # a tree dfa in incremental mode, and edges to add between its lower half of states
+    M = gen.tree_dfa(n)
+    M.incremental()
+    rng = random.Random(1)
+    return M, [(rng.randrange(n // 2, n), rng.randrange(n // 2, n), rng.choice('ab')) for _ in range(20)]
+
+def edit_incrementally(args):
+    M, edits = args
+    for q1, q2, a in edits:
+        M.add_edge(q1, q2, a)
+        M.tracker.update()
+
+def run_of_a(n):
+    # patterns a and a+b over a run of n a's: every position starts a match of a, and a+b stays alive to the end
+    S = scanner([compile_regex('a', A='ab'), compile_regex('a+b', A='ab')])
+    list(S.finditer('a'))
+    return S, 'a' * n
+
+def eps_closure(M):
+    M.invalidate_closure()
+    return M.eps_closure(set([0]))
+
+cases = [
+    case('to_dfa/blowup', [8, 10, 12, 14], [6, 8, 10], gen.blowup_nfa, lambda M: M.to_dfa(), states),
+    case('to_dfa/unicode_blowup', [8, 10, 12, 14], [6, 8, 10], gen.unicode_blowup, lambda M: M.to_dfa(), states),
+    case('to_dfa/random_nfa', [50, 100, 200, 400], [25, 50, 100], lambda n: gen.random_nfa(n, degree=0.8), lambda M: M.to_dfa(), states),
+    case('minimize/random_dfa', [250, 500, 1000, 2000], [125, 250, 500], gen.random_dfa, lambda M: M.minimize()),
+    case('minimize/blowup', [6, 8, 10, 12], [4, 6, 8], lambda k: gen.blowup_nfa(k).to_dfa(), lambda M: M.minimize(), lambda k, M: 2 ** (k + 1)),
+    case('remove_unreachable/random_dfa', [25000, 50000, 100000], [5000, 10000], lambda n: gen.random_dfa(n, A='a'),
+         lambda M: M.remove_unreachable_states()),
+    case('minimal_dfa/brzozowski', [6, 8, 10, 12], [4, 6, 8], gen.blowup_nfa, lambda M: M.minimal_dfa('brzozowski'), states),
+    case('minimal_dfa/incremental', [6, 8, 10, 12], [4, 6, 8], gen.blowup_nfa, lambda M: M.to_dfa(minimize_every=64), states),
+    case('incremental/tree_dfa', [4000, 16000, 64000], [2000, 8000], leaf_edits, edit_incrementally),
+    case('join/random_dfa', [50, 100, 200, 400], [25, 50, 100], lambda n: (gen.random_dfa(n, seed=1), gen.random_dfa(n, seed=2)),
+         lambda Ms: Ms[0].intersect(Ms[1]), states),
+    case('includes/blowup', [4, 6, 8, 10], [2, 4, 6], lambda k: (gen.blowup_nfa(k), gen.blowup_nfa(k - 1, 'aa')),
+         lambda Ms: Ms[0].includes(Ms[1]), lambda k, r: 2 ** (k + 1)),
+    case('equivalent/random_dfa', [500, 1000, 2000, 4000], [250, 500, 1000], lambda n: (gen.random_dfa(n), gen.random_dfa(n).minimize()),
+         lambda Ms: Ms[0].equivalent(Ms[1])),
+    case('count_words/random_dfa', [1000, 4000, 16000], [500, 2000], lambda n: (gen.random_dfa(200), n),
+         lambda args: args[0].count_words(args[1], modulus=2 ** 31 - 1)),
+    case('sample/random_dfa', [50, 100, 200], [25, 50], lambda n: (gen.random_dfa(200), n), lambda args: args[0].sample(args[1], 1000)),
+    case('accepts/dfa', [10000, 40000, 160000], [5000, 20000], lambda n: (gen.random_dfa(100), gen.random_word(n)),
+         lambda args: args[0].accepts(args[1])),
+    case('accepts/nfa', [1000, 4000, 16000], [500, 2000], lambda n: (gen.random_nfa(100, degree=1.5), gen.random_word(n)),
+         lambda args: args[0].accepts(args[1])),
+    case('accepts/compiled_dfa', [10000, 40000, 160000], [5000, 20000], lambda n: (gen.random_dfa(100).compile(), gen.random_word(n)),
+         lambda args: args[0].accepts(args[1])),
+    case('accepts/compiled_unicode', [10000, 40000, 160000], [5000, 20000],
+         lambda n: (gen.unicode_blowup(6).to_dfa().compile(), gen.random_word(n, 'aé€ωz9 ')), lambda args: args[0].accepts(args[1])),
+    case('search/leftmost_longest', [10000, 40000, 160000], [5000, 20000], run_of_a, lambda args: list(args[0].finditer(args[1]))),
+    case('eps_closure/chain', [500, 1000, 2000, 4000], [250, 500, 1000], gen.eps_chain, eps_closure),
+    case('eps_closure/cycle', [500, 1000, 2000, 4000], [250, 500, 1000], lambda n: gen.eps_chain(n, cycle=True), eps_closure),
+    case('cyk/dyck', [16, 32, 64, 128], [8, 16, 32], lambda n: (gen.dyck_cfg(), gen.dyck_word(n)), lambda args: args[0].cyk(args[1])),
+    case('cyk/arithmetic', [16, 32, 64, 128], [8, 16, 32], lambda n: (gen.arithmetic_cfg(), gen.arithmetic_word(n)),
+         lambda args: args[0].cyk(args[1])),
+    case('cyk/padded_arithmetic', [250, 1000, 4000], [100, 400], lambda k: (gen.padded_cfg(k), gen.arithmetic_word(32)),
+         lambda args: args[0].cyk(args[1])),
+    case('cyk/reject', [64, 128, 256], [32, 64], lambda n: (gen.arithmetic_cfg(), gen.arithmetic_word(n) + '('),
+         lambda args: args[0].cyk(args[1])),
+    case('earley/padded_arithmetic', [250, 1000, 4000], [100, 400], lambda k: (gen.padded_cfg(k), gen.arithmetic_word(200)),
+         lambda args: args[0].accepts(args[1])),
+]
+
+def best_time(c: case, size: int, repeat: int) -> tuple:
+    # best of repeat runs, each on a fresh input since some operations (minimize) work in place; and the output
+    best = math.inf
+    for _ in range(repeat):
+        x = c.setup(size)
+        start = time.perf_counter()
+        out = c.run(x)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+def peak_memory(c: case, size: int) -> int:
+    x = c.setup(size)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        c.run(x)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def exponent(points: list) -> float|None:
+    # least squares slope of log(time) against log(size)
+    points = [(math.log(n), math.log(t)) for n, t in points if t > 0]
+    if len(points) < 2: return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / sxx if sxx else None
+
+def run(selected: list, quick: bool=False, repeat: int=3) -> dict:
+    results = {}
+    for c in selected:
+        sizes = c.quick if quick else c.sizes
+        runs = {}
+        for size in sizes:
+            t, out = best_time(c, size, repeat)
+            r = runs[str(size)] = {'time': t, 'peak': peak_memory(c, size), 'measure': c.measure(size, out)}
+            print(f'{c.name:24} {size:>8} {r["measure"]:>8} {t:12.6f}s {r["peak"] / 2 ** 20:10.2f} MiB', flush=True)
+        slope = exponent([(r['measure'], r['time']) for r in runs.values()])
+        results[c.name] = {'runs': runs, 'exponent': slope}
+        print(f'{c.name:24} exponent {slope:.2f}' if slope is not None else f'{c.name:24} exponent -', flush=True)
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'quick': quick, 'cases': results}
+
+def compare(results: dict, baseline: dict, tolerance: float=1.5, noise: float=1e-3) -> list:
+    """regressions of results against baseline: times and peaks more than tolerance times those of the baseline.
+    Times below noise seconds in both are not compared."""
+    regressions = []
+    for name, res in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None: continue
+        for size, r in res['runs'].items():
+            b = base['runs'].get(size)
+            if b is None: continue
+            if max(r['time'], b['time']) >= noise and r['time'] > tolerance * b['time']:
+                regressions.append(f'{name} size {size}: time {r["time"]:.6f}s vs {b["time"]:.6f}s in the baseline')
+            if r['peak'] > tolerance * b['peak'] and r['peak'] - b['peak'] > 64 * 1024:
+                regressions.append(f'{name} size {size}: peak {r["peak"]} bytes vs {b["peak"]} in the baseline')
+    return regressions
+
+def main(argv: list|None=None) -> int:
+    parser = argparse.ArgumentParser(description='benchmarks of AutoLib constructions')
+    parser.add_argument('--only', default='*', help='glob over case names, e.g. "minimize/*"')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size, the best is kept')
+    parser.add_argument('--out', default=os.path.join(here, 'results.json'))
+    parser.add_argument('--baseline', default=None, help='results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown factor against the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='also write the results to bench/baseline.json')
+    args = parser.parse_args(argv)
+    selected = [c for c in cases if fnmatch.fnmatch(c.name, args.only)]
+    assert selected, f'no case matches {args.only}'
+    results = run(selected, args.quick, args.repeat)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(os.path.join(here, 'baseline.json'), 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline is None: return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('quick') != results['quick']:
+        print('warning: baseline and results were run with different --quick settings')
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print('REGRESSION', r)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,157 @@
 from typing import Any
 
+class sppf_node:
+    """node of a shared packed parse forest (SPPF). A symbol node stands for a terminal or nonterminal deriving
+    word[start:end]; an intermediate node (label (lhs, rhs, dot)) for the prefix rhs[:dot] of a rule. Each family is one
+    way of deriving the node, given as a tuple of child nodes (() for an ϵ-derivation), so shared subtrees are stored once."""
+    __slots__ = ('label', 'start', 'end', 'intermediate', 'families', '_family_set')
+    def __init__(self, label: Any, start: int, end: int, intermediate: bool=False) -> None:
+        self.label = label
+        self.start = start
+        self.end = end
+        self.intermediate = intermediate
+        self.families: list[tuple] = []
+        self._family_set: set = set()
+
+    def add_family(self, children: tuple):
+        if children in self._family_set: return
+        self._family_set.add(children)
+        self.families.append(children)
+
+    def nodes(self):
+        # every node of the forest below (and including) this one, each once
+        seen = set([id(self)])
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            for family in node.families:
+                for child in family:
+                    if id(child) not in seen:
+                        seen.add(id(child))
+                        stack.append(child)
+
+    def is_ambiguous(self) -> bool:
+        return any(len(node.families) > 1 for node in self.nodes())
+
+    def _sequences(self):
+        # child-tree sequences an intermediate node stands for
+        for family in self.families:
+            if not family:
+                yield []
+                continue
+            *left, right = family
+            lefts = left[0]._sequences() if left and left[0].intermediate else ([t] for t in left[0].trees()) if left else iter([[]])
+            for seq in lefts:
+                for t in right.trees():
+                    yield seq + [t]
+
+    def trees(self):
+        """lazily enumerate the parse trees of this node as nested (symbol, [children]) tuples with terminals as leaves.
+        There can be exponentially many (infinitely many for cyclic grammars)."""
+        if not self.families:
+            yield self.label
+            return
+        for family in self.families:
+            if not family:
+                yield (self.label, [])
+            elif len(family) == 1 and not family[0].intermediate:
+                for t in family[0].trees():
+                    yield (self.label, [t])
+            else:
+                node = sppf_node(self.label, self.start, self.end, intermediate=True)
+                node.families = [family]
+                for seq in node._sequences():
+                    yield (self.label, seq)
+
+    def __repr__(self):
+        if self.intermediate:
+            lhs, rhs, dot = self.label
+            label = f'{lhs} -> {" ".join(map(str, rhs[:dot]))} . {" ".join(map(str, rhs[dot:]))}'
+        else:
+            label = str(self.label)
+        return f'({label}, {self.start}, {self.end})'
+
+def _derivable(rules: list, given=frozenset()) -> set:
+    # the least set of lhs with a rule whose symbols are all in given or in the set: the nullable nonterminals for
+    # given = {}, the generating ones for given = the terminals. Each rule counts its symbols still missing, and
+    # a worklist of the symbols found decrements them, so every rule is visited once per symbol
+    missing = []
+    uses: dict = {}
+    found = set()
+    stack = []
+    for r, (A, rhs) in enumerate(rules):
+        need = [X for X in rhs if X not in given]
+        missing.append(len(need))
+        for X in need:
+            uses.setdefault(X, []).append(r)
+        if not need and A not in found:
+            found.add(A)
+            stack.append(A)
+    while stack:
+        for r in uses.get(stack.pop(), ()):
+            missing[r] -= 1
+            A = rules[r][0]
+            if missing[r] == 0 and A not in found:
+                found.add(A)
+                stack.append(A)
+    return found
+
+def _propagate(sets: dict, feeds: dict) -> dict:
+    # least sets with sets[Y] >= sets[X] for every Y in feeds[X], by a worklist of the sets that grew
+    stack = list(sets)
+    while stack:
+        X = stack.pop()
+        for Y in feeds.get(X, ()):
+            if not sets[X] <= sets.setdefault(Y, set()):
+                sets[Y] |= sets[X]
+                stack.append(Y)
+    return sets
+
+def _first(rules: list, N: set, nullable: set) -> dict:
+    # nonterminal -> the terminals its derivations start with
+    first = {A: set() for A, _ in rules}
+    feeds: dict = {}
+    for A, rhs in rules:
+        for X in rhs:
+            if X not in N:
+                first[A].add(X)
+                break
+            feeds.setdefault(X, set()).add(A)
+            if X not in nullable: break
+    return _propagate(first, feeds)
+
+def _follow(rules: list, N: set, nullable: set, first: dict, S, end) -> dict:
+    # symbol (nonterminal or terminal) -> the terminals that come right after it in the sentential forms of S, and end
+    # if it can come last
+    follow: dict = {S: set([end])}
+    feeds: dict = {}
+    for A, rhs in rules:
+        # right to left, with the first terminals of the rest of the rhs and whether it is nullable
+        after: set = set()
+        rest_nullable = True
+        for X in reversed(rhs):
+            follow.setdefault(X, set()).update(after)
+            if rest_nullable: feeds.setdefault(A, set()).add(X)
+            if X in nullable:
+                after = after | first[X]
+            else:
+                after = set(first.get(X, ())) if X in N else set([X])
+                rest_nullable = False
+    return _propagate(follow, feeds)
+
 class CFG:
+    eps = 'ϵ'
+    # end of input in FOLLOW sets
+    end = '⊣'
     def __init__(self, N: set|list|int, A: set|list|int, S: Any) -> None:
         self.N = self._format(N)
         self.A = self._format(A)
         self.S = S
         assert self.S in self.N, f'S = {self.S} not in N = {self.N}'
         self.P: dict[str, set] = {}
+        # derived data (e.g. the CNF), dropped whenever the productions change
+        self._cache: dict = {}
 
     def _format(self, obj: list|str):
         if isinstance(obj, set):
@@ -17,14 +162,32 @@ class CFG:
             return set(range(obj))
         assert False, f'obj = {obj} is not a set, list or int'
     
-    def add_production(self, lhs: str, rhs: str):
+    def add_production(self, lhs: str, rhs: str|tuple):
         if lhs not in self.P:
             self.P[lhs] = set()
         self.P[lhs].add(rhs)
+        self._cache = {}
     
     def remove_production(self, lhs, rhs):
         if lhs not in self.P: return
         self.P[lhs].discard(rhs)
+        self._cache = {}
+
+    def save(self, path: str):
+        """write this grammar to path in the binary format of serialize.py"""
+        import serialize
+        serialize.save(self, path)
+
+    @staticmethod
+    def load(path: str) -> 'CFG':
+        import serialize
+        G = serialize.load(path)
+        assert isinstance(G, CFG), f'{path} holds a {type(G).__name__}, not a CFG'
+        return G
+
+    def _format_rhs(self, rhs):
+        if isinstance(rhs, str): return rhs
+        return ' '.join(str(X) for X in rhs) if rhs else self.eps
 
     def __repr__(self):
         res = ''
@@ -32,35 +195,461 @@ class CFG:
             if rhs == set():
                 res += str(lhs) + ' -> ø\n'
             else:
-                res += str(lhs) + ' -> ' + ' | '.join(rhs) + '\n'
+                res += str(lhs) + ' -> ' + ' | '.join(self._format_rhs(prod) for prod in rhs) + '\n'
         return res[:-1]
     
-    def cyk(self, x: str):
-        table = [[set() for _ in range(len(x)+1)] for __ in range(len(x))]
-        # S E table[i][j] iff S -> x[i:j] is valid
-        # suppose the grammar is Chomsky. Then we have: S E table[i][j] iff there exists k, A, B: S = AB, A -> i,k and B -> k,j; or j == i+1 and S -> x[i]
-        for S, prods in self.P.items():
-            for prod in prods:
-                if len(prod) > 1: continue
-                for i, c in enumerate(x):
-                    if prod == c: 
-                        table[i][i+1].add(S)
-        for i in range(len(x)):
-            for j in range(i, len(x)+1):
-                for S, prods in self.P.items():
-                    for prod in prods:
-                        if len(prod) == 1: continue
-                        A = prod[0]
-                        B = prod[1]
-                        for k in range(i, j):
-                            if table[i][k]:
+    def symbols(self, rhs) -> tuple:
+        # right-hand sides are strings of one-character symbols ('ϵ' or '' for the empty string) or tuples of symbols
+        if isinstance(rhs, tuple): return rhs
+        return () if rhs in ('', self.eps) else tuple(rhs)
+
+    def _fresh(self, name: str, taken: set):
+        while name in taken:
+            name += "'"
+        taken.add(name)
+        return name
+
+    # Analysis, computed by worklist fixpoints in time linear in the size of the grammar (up to the set unions of
+    # FIRST and FOLLOW) and cached until the productions change.
+
+    def _analysis(self, key: str, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _productions(self) -> list:
+        return self._analysis('productions', lambda: [(A, self.symbols(rhs)) for A, rhss in self.P.items() for rhs in rhss])
+
+    def nullable(self) -> set:
+        """the nonterminals that derive ϵ"""
+        return self._analysis('nullable', lambda: _derivable(self._productions()))
+
+    def generating(self) -> set:
+        """the nonterminals that derive some word of terminals"""
+        def compute():
+            rules = self._productions()
+            return _derivable(rules, set(X for _, rhs in rules for X in rhs if X not in self.N))
+        return self._analysis('generating', compute)
+
+    def reachable(self) -> set:
+        """the nonterminals that occur in some sentential form of S"""
+        def compute():
+            seen = set([self.S])
+            stack = [self.S]
+            while stack:
+                for rhs in self.P.get(stack.pop(), ()):
+                    for X in self.symbols(rhs):
+                        if X in self.N and X not in seen:
+                            seen.add(X)
+                            stack.append(X)
+            return seen
+        return self._analysis('reachable', compute)
+
+    def first(self) -> dict:
+        """FIRST sets: nonterminal -> the terminals its derivations start with"""
+        return self._analysis('first', lambda: _first(self._productions(), self.N, self.nullable()))
+
+    def first_of(self, symbols) -> set:
+        """the terminals the derivations of the sequence symbols (a rhs) start with, and ϵ if it is nullable"""
+        first, nullable = self.first(), self.nullable()
+        out = set()
+        for X in self.symbols(symbols):
+            if X not in self.N:
+                out.add(X)
+                return out
+            out |= first.get(X, set())
+            if X not in nullable: return out
+        out.add(self.eps)
+        return out
+
+    def follow(self) -> dict:
+        """FOLLOW sets: symbol (nonterminal or terminal) -> the terminals that come right after it in some sentential
+        form of S, and CFG.end if it can come last"""
+        return self._analysis('follow', lambda: _follow(self._productions(), self.N, self.nullable(), self.first(), self.S, self.end))
+
+    def remove_useless(self) -> 'CFG':
+        """equivalent grammar without the useless nonterminals (those deriving no word, then those not reachable from S)
+        and their productions; S is kept, without productions if the language is empty"""
+        generating = self.generating()
+        G = CFG((self.N & generating) | set([self.S]), set(self.A), self.S)
+        for A, rhss in self.P.items():
+            if A not in generating: continue
+            for rhs in rhss:
+                if all(X in generating or X not in self.N for X in self.symbols(rhs)):
+                    G.add_production(A, rhs)
+        useful = G.reachable()
+        G.N = useful | set([self.S])
+        G.P = {A: rhss for A, rhss in G.P.items() if A in useful}
+        G._cache = {}
+        return G
+
+    def trimmed(self) -> 'CFG':
+        # remove_useless, cached until the productions change; the parsers work on it
+        return self._analysis('trimmed', self.remove_useless)
+
+    def may_accept(self, word) -> bool:
+        """False if word is certainly not in the language, by one linear scan: its first symbol must be in FIRST(S),
+        every next one in FOLLOW of the one before, and CFG.end in FOLLOW of the last (on the grammar without useless
+        symbols). True does not mean the word is in the language."""
+        G = self.trimmed()
+        if len(word) == 0: return G.S in G.nullable()
+        follow = G.follow()
+        if word[0] not in G.first().get(G.S, ()): return False
+        for i in range(1, len(word)):
+            if word[i] not in follow.get(word[i - 1], ()): return False
+        return G.end in follow.get(word[-1], ())
+
+    def to_cnf(self) -> 'CFG':
+        """equivalent grammar in Chomsky normal form: every rhs is a single terminal or two nonterminals, and only the
+        start symbol may derive ϵ (in which case it appears on no rhs). Right-hand sides of the result are tuples."""
+        taken = set(self.N) | set(self.A)
+        rules = [(A, self.symbols(rhs)) for A, rhss in self.P.items() for rhs in rhss]
+
+        # START: a fresh start symbol, so the start symbol never appears on a rhs
+        S0 = self._fresh('<S0>', taken)
+        rules.append((S0, (self.S,)))
+        N = set(self.N) | set([S0])
+
+        # TERM: terminals inside rules of length >= 2 get their own nonterminal
+        term: dict = {}
+        lifted = []
+        for A, rhs in rules:
+            if len(rhs) >= 2:
+                for X in rhs:
+                    if X in N or X in term: continue
+                    term[X] = self._fresh(f'<{X}>', taken)
+                    lifted.append((term[X], (X,)))
+                rhs = tuple(term.get(X, X) for X in rhs)
+            lifted.append((A, rhs))
+        N.update(term.values())
+        rules = lifted
+
+        # BIN: A -> X1 X2 ... Xk becomes A -> X1 <A1>, <A1> -> X2 <A2>, ..., <Ak-2> -> Xk-1 Xk
+        binary = []
+        for A, rhs in rules:
+            lhs = A
+            for i in range(1, len(rhs) - 1):
+                A2 = self._fresh(f'<{A}{i}>', taken)
+                N.add(A2)
+                binary.append((lhs, (rhs[0], A2)))
+                lhs, rhs = A2, rhs[1:]
+            binary.append((lhs, rhs))
+        rules = binary
+
+        # DEL: drop ϵ-rules, adding every variant of a rule with nullable symbols left out
+        nullable = _derivable(rules)
+        expanded = set()
+        for A, rhs in rules:
+            variants = [()]
+            for X in rhs:
+                variants = [v + (X,) for v in variants] + (variants if X in nullable else [])
+            expanded.update((A, v) for v in variants if v)
+        if S0 in nullable:
+            expanded.add((S0, ()))
+
+        # UNIT: A -> B is replaced by A -> rhs for every non-unit rule B -> rhs, B reachable from A by unit rules
+        unit_edges: dict = {}
+        by_lhs: dict = {}
+        for A, rhs in expanded:
+            if len(rhs) == 1 and rhs[0] in N:
+                unit_edges.setdefault(A, set()).add(rhs[0])
+            else:
+                by_lhs.setdefault(A, set()).add(rhs)
+        unit = {}
+        for A in N:
+            unit[A] = set([A])
+            stack = [A]
+            while stack:
+                for B in unit_edges.get(stack.pop(), ()):
+                    if B not in unit[A]:
+                        unit[A].add(B)
+                        stack.append(B)
+
+        G = CFG(N, set(self.A), S0)
+        for A in N:
+            for B in unit[A]:
+                for rhs in by_lhs.get(B, ()):
+                    G.add_production(A, rhs)
+        return G
+
+    def cnf(self) -> 'CFG':
+        # to_cnf of the grammar without useless symbols, trimmed again (UNIT leaves nonterminals only reached through
+        # unit rules unreachable), cached until the productions change
+        return self._analysis('cnf', lambda: self.trimmed().to_cnf().remove_useless())
+
+    def _cyk_tables(self):
+        # the CNF, its interned nonterminals, the lexical index terminal -> mask of A with A -> terminal, the binary
+        # rules by left symbol, and for pruning the chart, terminal (or CFG.end) -> mask of the nonterminals it can
+        # come right after (after) and right before (before)
+        def compute():
+            G = self.cnf()
+            bit = {A: 1 << i for i, A in enumerate(G.N)}
+            lexical: dict = {}
+            pairs: dict = {}
+            for A, rhss in G.P.items():
+                for rhs in rhss:
+                    if len(rhs) == 1:
+                        lexical[rhs[0]] = lexical.get(rhs[0], 0) | bit[A]
+                    elif len(rhs) == 2:
+                        B, C = rhs
+                        pairs.setdefault(B, {})
+                        pairs[B][C] = pairs[B].get(C, 0) | bit[A]
+            by_left = [None] * len(bit)
+            right_any = [0] * len(bit)
+            for B, Cs in pairs.items():
+                i = bit[B].bit_length() - 1
+                by_left[i] = [(bit[C], As) for C, As in Cs.items()]
+                right_any[i] = sum(bit[C] for C in Cs)
+            # FOLLOW of G, and of G with every rhs reversed (which holds what comes right before)
+            rules = G._productions()
+            backwards = [(A, rhs[::-1]) for A, rhs in rules]
+            nullable = G.nullable()
+            sides = []
+            for follow in (G.follow(), _follow(backwards, G.N, nullable, _first(backwards, G.N, nullable), G.S, G.end)):
+                masks: dict = {}
+                for A in G.N:
+                    for a in follow.get(A, ()):
+                        masks[a] = masks.get(a, 0) | bit[A]
+                sides.append(masks)
+            return G, bit, lexical, by_left, right_any, sides[0], sides[1]
+        return self._analysis('cyk', compute)
+
+
+    def cyk(self, x) -> bool:
+        """CYK membership test for x (a string, or a list of terminal tokens), on the CNF of this grammar. Chart cells
+        are bitsets over the interned nonterminals and binary rules are indexed by their left symbol, so filling a cell
+        costs one AND per split point and candidate rule instead of a scan over all productions. Words may_accept
+        rules out are rejected before any chart is built, and cells keep only nonterminals compatible with the symbols
+        around their span."""
+        if not self.may_accept(x): return False
+        G, bit, lexical, by_left, right_any, after, before = self._cyk_tables()
+        n = len(x)
+        if n == 0:
+            return () in G.P.get(G.S, ())
+
+        # table[i][l] = mask of the nonterminals deriving x[i:i+l]
+        # where x[i:i+l] is followed by x[i+l] and preceded by x[i-1], only the nonterminals with x[i+l] in their
+        # FOLLOW and x[i-1] in their PRECEDE can be part of a derivation of x, so the others are masked out
+        table = [[0] * (n - i + 1) for i in range(n)]
+        left = [before.get(x[i - 1], 0) if i else before.get(G.end, 0) for i in range(n)]
+        right = [after.get(x[i], 0) for i in range(n)] + [after.get(G.end, 0)]
+        for i, c in enumerate(x):
+            table[i][1] = lexical.get(c, 0) & left[i] & right[i + 1]
+            if not table[i][1]: return False
+        for l in range(2, n + 1):
+            for i in range(n - l + 1):
+                m = 0
+                for s in range(1, l):
+                    L = table[i][s]
+                    if not L: continue
+                    R = table[i + s][l - s]
+                    if not R: continue
+                    while L:
+                        low = L & -L
+                        L ^= low
+                        B = low.bit_length() - 1
+                        if not right_any[B] & R: continue
+                        for C, As in by_left[B]:
+                            if C & R: m |= As
+                table[i][l] = m & left[i] & right[i + l]
+        return bool(table[0][n] & bit[G.S])
         
+    def _rules(self):
+        # productions of the grammar without useless symbols as a list of (lhs, rhs tuple), indexed by lhs, the
+        # nullable nonterminals, predict(X, a): the rules of X whose rhs can start with a (or is nullable), the
+        # only ones worth predicting before a, and the index of an extra rule S' -> S with S' on no rhs; cached, and
+        # predict memoized, until the productions change
+        def compute():
+            G = self.trimmed()
+            rules = G._productions() + [(self._fresh("<S'>", set(self.N) | set(self.A)), (G.S,))]
+            by_lhs: dict = {}
+            for r, (A, rhs) in enumerate(rules):
+                by_lhs.setdefault(A, []).append(r)
+            starts = [G.first_of(rhs) for _, rhs in rules]
+            memo: dict = {}
+            def predict(X, a) -> list:
+                key = (X, a)
+                if key not in memo:
+                    memo[key] = [r for r in by_lhs.get(X, ()) if a in starts[r] or self.eps in starts[r]]
+                return memo[key]
+            return rules, by_lhs, G.nullable(), predict, len(rules) - 1
+        return self._analysis('rules', compute)
+
+    def _earley_recognize(self, x) -> bool:
+        # Earley recognizer over (rule, dot, origin) items, with Aycock and Horspool's handling of nullable symbols and
+        # Leo's memoized deterministic reduction paths, which makes right recursion linear instead of quadratic. A Leo
+        # step adds only the topmost item of a path, skipping the completions below it, so a completed S (which may
+        # end the rhs of another rule) is not looked for; the word is accepted when S' -> S completes instead, which
+        # as S' is on no rhs is always at the top of its path
+        if not self.may_accept(x): return False
+        rules, _, nullable, predict, start = self._rules()
+        n = len(x)
+        E: list[list] = [[] for _ in range(n + 1)]
+        seen: list[set] = [set() for _ in range(n + 1)]
+        # waiting[i][X] = items of E[i] with the dot before X (the completion and scanning index)
+        waiting: list[dict] = [{} for _ in range(n + 1)]
+        leo_memo: dict = {}
+
+        def add(i, item):
+            if item in seen[i]: return
+            seen[i].add(item)
+            E[i].append(item)
+            rhs = rules[item[0]][1]
+            if item[1] < len(rhs):
+                waiting[i].setdefault(rhs[item[1]], []).append(item)
+
+        def leo(j, A):
+            # topmost complete item of the deterministic reduction path above (A, j), or None
+            key = (j, A)
+            chain = []
+            top = None
+            visited = set()
+            while True:
+                if (j, A) in leo_memo:
+                    top = leo_memo[(j, A)]
+                    break
+                items = waiting[j].get(A, ())
+                if len(items) != 1 or (j, A) in visited: break
+                r, dot, k = items[0]
+                if dot + 1 != len(rules[r][1]): break
+                visited.add((j, A))
+                chain.append(((j, A), (r, dot + 1, k)))
+                j, A = k, rules[r][0]
+            for link, item in reversed(chain):
+                top = top if top is not None else item
+                leo_memo[link] = top
+            if not chain: leo_memo[key] = top
+            return leo_memo[key]
+
+        add(0, (start, 0, 0))
+        for i in range(n + 1):
+            k = 0
+            while k < len(E[i]):
+                r, dot, h = E[i][k]
+                k += 1
+                lhs, rhs = rules[r]
+                if dot < len(rhs):
+                    X = rhs[dot]
+                    if X not in self.N: continue
+                    for r2 in predict(X, x[i] if i < n else self.end):
+                        add(i, (r2, 0, i))
+                    if X in nullable:
+                        add(i, (r, dot + 1, h))
+                    continue
+                top = leo(h, lhs) if h < i else None
+                if top is not None:
+                    add(i, top)
+                    continue
+                for r2, dot2, h2 in list(waiting[h].get(lhs, ())):
+                    add(i, (r2, dot2 + 1, h2))
+            if i == n: break
+            for r, dot, h in waiting[i].get(x[i], ()):
+                add(i + 1, (r, dot + 1, h))
+            if not E[i + 1]: return False
+        return (start, 1, 0) in seen[n]
+
+    def _earley_parse(self, x):
+        # Scott's SPPF-building Earley parser (Scott 2008): items carry the forest node of their matched prefix,
+        # and nodes are shared through V, the nodes ending at the current position
+        rules, _, nullable, predict, _ = self._rules()
+        N = self.N
+        n = len(x)
+        E: list[list] = [[] for _ in range(n + 1)]
+        seen: list[set] = [set() for _ in range(n + 1)]
+        waiting: list[dict] = [{} for _ in range(n + 1)]
+
+        def add(i, item):
+            if item in seen[i]: return
+            seen[i].add(item)
+            E[i].append(item)
+            rhs = rules[item[0]][1]
+            if item[1] < len(rhs):
+                waiting[i].setdefault(rhs[item[1]], []).append(item)
+
+        def make_node(r, dot, j, i, w, v, V):
+            lhs, rhs = rules[r]
+            if dot == 1 and dot < len(rhs): return v
+            key = ('symbol', lhs, j) if dot == len(rhs) else ('item', r, dot, j)
+            if key not in V:
+                V[key] = sppf_node(lhs, j, i) if dot == len(rhs) else sppf_node((lhs, rhs, dot), j, i, intermediate=True)
+            y = V[key]
+            y.add_family((v,) if w is None else (w, v))
+            return y
+
+        def advance(i, item, Q):
+            # items with a terminal after the dot wait in Q for the scan of x[i]; the others go to E[i]
+            r, dot, h, w = item
+            rhs = rules[r][1]
+            if dot == len(rhs) or rhs[dot] in N: add(i, item)
+            elif i < n and rhs[dot] == x[i]: Q.add(item)
+
+        Q_next: set = set()
+        for r in predict(self.S, x[0] if n else self.end):
+            advance(0, (r, 0, 0, None), Q_next)
+        V: dict = {}
+        for i in range(n + 1):
+            H: dict = {}
+            Q, Q_next = Q_next, set()
+            k = 0
+            while k < len(E[i]):
+                r, dot, h, w = E[i][k]
+                k += 1
+                lhs, rhs = rules[r]
+                if dot < len(rhs):
+                    C = rhs[dot]
+                    for r2 in predict(C, x[i] if i < n else self.end):
+                        advance(i, (r2, 0, i, None), Q)
+                    if C in H:
+                        advance(i, (r, dot + 1, h, make_node(r, dot + 1, h, i, w, H[C], V)), Q)
+                    continue
+                if w is None:
+                    if ('symbol', lhs, i) not in V: V[('symbol', lhs, i)] = sppf_node(lhs, i, i)
+                    w = V[('symbol', lhs, i)]
+                    w.add_family(())
+                if h == i: H[lhs] = w
+                for r2, dot2, h2, z in list(waiting[h].get(lhs, ())):
+                    advance(i, (r2, dot2 + 1, h2, make_node(r2, dot2 + 1, h2, i, z, w, V)), Q)
+            if i == n: break
+            V = {}
+            v = sppf_node(x[i], i, i + 1)
+            for r, dot, h, w in Q:
+                advance(i + 1, (r, dot + 1, h, make_node(r, dot + 1, h, i + 1, w, v, V)), Q_next)
+            if not E[i + 1] and not Q_next: return None
+        return V.get(('symbol', self.S, 0))
+
+    def parse(self, word, algorithm: str='earley'):
+        """shared packed parse forest (sppf_node) of word (a string, or a list of terminal tokens) for the start
+        symbol, or None if the word is not in the language. Works on P directly, ϵ-productions included."""
+        assert algorithm == 'earley', f'algorithm = {algorithm} builds no parse forest, use accepts'
+        # the Leo-optimized recognizer rejects in linear time before any forest is built
+        if not self._earley_recognize(word): return None
+        return self._earley_parse(word)
+
+    def accepts(self, word, algorithm: str='earley') -> bool:
+        assert algorithm in ('earley', 'cyk'), f'algorithm = {algorithm} is not one of earley, cyk'
+        if algorithm == 'cyk':
+            return self.cyk(word)
+        return self._earley_recognize(word)
+
 if __name__ == '__main__':
     cfg = CFG({'S', 'A', 'B'}, {'a', 'b'}, 'S')
     cfg.add_production('S', 'aSb')
     cfg.add_production('S', 'a')
     print(cfg)
-    print(cfg.check('aab'))
+    print(cfg.cyk('aab'))
+
+    # Earley against CYK where S ends the rhs of other rules, so completions of S lie inside Leo's reduction paths
+    from itertools import product
+    grammars = [[('S', 'A'), ('S', 'ϵ'), ('B', 'BS'), ('B', 'ϵ'), ('A', 'aaS'), ('A', 'BB'), ('C', 'ϵ')],
+                [('S', 'aS'), ('S', 'b'), ('A', 'aS')],
+                [('S', 'aA'), ('S', 'ϵ'), ('A', 'bS'), ('A', 'S')]]
+    for rules in grammars:
+        G = CFG(set(A for A, _ in rules), {'a', 'b'}, 'S')
+        for A, rhs in rules:
+            G.add_production(A, rhs)
+        for n in range(7):
+            for w in map(''.join, product('ab', repeat=n)):
+                assert G.accepts(w) == G.cyk(w) == (G.parse(w) is not None), f'{w!r} in\n{G}'
 
 # def check_(self, word: str):
 #         # we will keep trying to replace non-terminals with their productions
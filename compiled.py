@@ -0,0 +1,335 @@
+import numpy as np
+from array import array
+from automaton import iter_bits
+from symbolic import classifier
+
+class compiled_nfa:
+    """frozen, integer-indexed form of an nfa for fast simulation. States are interned to bit positions,
+    so a set of states is a single int. For every symbol a and every byte-sized chunk of states, the
+    union of the successors of the states set in that byte is tabulated (on first use), so one step of
+    the run is one OR per non-zero byte of the current mask. For large NFAs method='numpy' stores the
+    transitions as |Q| x |Q| boolean matrices instead."""
+    numpy_threshold = 4096
+
+    def __init__(self, Q, A, Q_0, F, delta: dict, method: str='auto') -> None:
+        # delta maps (q, a) to the set of successors of q on a; for an eps_nfa these must already be eps-closed
+        self.states = list(Q)
+        self.index = {q: i for i, q in enumerate(self.states)}
+        self.symbols = list(A)
+        self.symbol_index = {a: i for i, a in enumerate(self.symbols)}
+        # over char_class symbols (see symbolic.py) characters are looked up by the class they are in
+        self.classes = classifier.of(self.symbols)
+        # byte value -> symbol index, for matching over bytes/memoryview input
+        if self.classes is None: self.byte_index = [self.symbol_index.get(chr(b), -1) for b in range(256)]
+        else: self.byte_index = self.classes.byte_table().tolist()
+        self.n = len(self.states)
+        self.nbytes = max(1, (self.n + 7) // 8)
+        self.start = self.mask(Q_0)
+        self.final = self.mask(F)
+        if method == 'auto':
+            method = 'numpy' if self.n > self.numpy_threshold else 'bitset'
+        assert method in ('bitset', 'numpy'), f'method = {method} is not one of bitset, numpy'
+        self.method = method
+
+        succ = [[0] * self.n for _ in self.symbols]
+        for (q, a), q2s in delta.items():
+            if a not in self.symbol_index: continue
+            succ[self.symbol_index[a]][self.index[q]] = self.mask(q2s)
+        self.succ = succ
+        if method == 'bitset':
+            # tables[a][c][b] = union of succ[a][8c + i] over the bits i set in the byte b (None until needed)
+            self.tables = [[None] * self.nbytes for _ in self.symbols]
+        else:
+            self.matrices = np.zeros((len(self.symbols), self.n, self.n), dtype=bool)
+            for a, row in enumerate(succ):
+                for i, m in enumerate(row):
+                    if m: self.matrices[a, i] = self._to_bool(m)
+
+    @classmethod
+    def from_csr(cls, symbols: list, n: int, indptr, indices, start, final, states: list|None=None, method: str='auto') -> 'compiled_nfa':
+        """compiled_nfa from successor lists in CSR layout (see to_csr), over the states 0..n-1 unless labels are given"""
+        states = list(range(n)) if states is None else list(states)
+        delta = {}
+        for a, symbol in enumerate(symbols):
+            for i in range(n):
+                lo, hi = int(indptr[a * n + i]), int(indptr[a * n + i + 1])
+                if hi > lo: delta[(states[i], symbol)] = [states[j] for j in indices[lo:hi].tolist()]
+        return cls(states, symbols, [states[i] for i in start], [states[i] for i in final], delta, method)
+
+    def to_csr(self) -> dict:
+        """flat int arrays: the successors of state i on symbol a are indices[indptr[a*n+i]:indptr[a*n+i+1]]; start and
+        final list the start and final state indices"""
+        indptr = [0]
+        indices = []
+        for row in self.succ:
+            for m in row:
+                indices.extend(iter_bits(m))
+                indptr.append(len(indices))
+        return {'indptr': np.array(indptr, dtype=np.int64), 'indices': np.array(indices, dtype=np.int32),
+                'start': np.array(list(iter_bits(self.start)), dtype=np.int32), 'final': np.array(list(iter_bits(self.final)), dtype=np.int32)}
+
+    def mask(self, X) -> int:
+        m = 0
+        for q in X:
+            m |= 1 << self.index[q]
+        return m
+
+    def states_of(self, m: int) -> set:
+        return set(self.states[i] for i in iter_bits(m))
+
+    def _to_bool(self, m: int):
+        bits = np.unpackbits(np.frombuffer(m.to_bytes(self.nbytes, 'little'), dtype=np.uint8), bitorder='little')
+        return bits[:self.n].astype(bool)
+
+    def _from_bool(self, v) -> int:
+        return int.from_bytes(np.packbits(v, bitorder='little').tobytes(), 'little')
+
+    def _table(self, a: int, c: int):
+        table = self.tables[a][c]
+        if table is None:
+            row = self.succ[a][8*c:8*c+8]
+            row += [0] * (8 - len(row))
+            table = [0] * 256
+            for b in range(1, 256):
+                low = b & -b
+                table[b] = table[b ^ low] | row[low.bit_length() - 1]
+            self.tables[a][c] = table
+        return table
+
+    def _symbols(self, word):
+        if isinstance(word, (bytes, bytearray, memoryview)):
+            byte_index = self.byte_index
+            return (byte_index[b] for b in memoryview(word).cast('B'))
+        if self.classes is not None: return self.classes.indices(word)
+        symbol_index = self.symbol_index
+        return (symbol_index.get(a, -1) for a in word)
+
+    def step(self, m: int, a: int) -> int:
+        # a is a symbol index; -1 (a symbol outside A) kills the run
+        if a < 0 or not m: return 0
+        nxt = 0
+        tables = self.tables[a]
+        for c, b in enumerate(m.to_bytes(self.nbytes, 'little')):
+            if b:
+                table = tables[c]
+                if table is None: table = self._table(a, c)
+                nxt |= table[b]
+        return nxt
+
+    def run(self, word, m: int|None=None) -> int:
+        """mask of the states reached from m (default: the start states) on word"""
+        m = self.start if m is None else m
+        if self.method == 'numpy':
+            v = self._to_bool(m)
+            for a in self._symbols(word):
+                if a < 0: return 0
+                v = self.matrices[a][v].any(axis=0)
+                if not v.any(): return 0
+            return self._from_bool(v)
+        for a in self._symbols(word):
+            m = self.step(m, a)
+            if not m: return 0
+        return m
+
+    def accepts(self, word) -> bool:
+        return self.run(word) & self.final != 0
+
+    def matcher(self) -> 'nfa_matcher':
+        return nfa_matcher(self)
+
+class nfa_matcher:
+    """resumable run of a compiled_nfa over input that arrives in chunks (str or bytes); the current set of states is
+    one |Q|-bit mask"""
+    __slots__ = ('M', 'mask')
+
+    def __init__(self, M: compiled_nfa) -> None:
+        self.M = M
+        self.reset()
+
+    def reset(self):
+        self.mask = self.M.start
+        return self
+
+    def feed(self, chunk):
+        if self.mask: self.mask = self.M.run(chunk, self.mask)
+        return self
+
+    @property
+    def state(self) -> set:
+        return self.M.states_of(self.mask)
+
+    def is_accepting(self) -> bool:
+        return self.mask & self.M.final != 0
+
+class compiled_dfa:
+    """frozen, array-backed form of a dfa. States are interned to 0..|Q|-1 (the start state is 0) and symbols
+    to 0..|A|-1; table[q, a] is the successor of q on a, or -1 where delta is undefined. Internally an extra
+    dead state |Q| and an extra column |A| for symbols outside A make every lookup total, so a run is one
+    table lookup per symbol and accepts_many advances a whole batch of words with one vectorized lookup per position."""
+    __slots__ = ('states', 'index', 'symbols', 'symbol_index', 'classes', 'byte_index', 'n', 'k', 'full', 'final', 'rows', '_codes', '_code_symbols', '_frozen')
+
+    def __init__(self, Q, A, Q_0, F, delta: dict) -> None:
+        states = [Q_0] + [q for q in Q if q != Q_0]
+        index = {q: i for i, q in enumerate(states)}
+        symbols = list(A)
+        symbol_index = {a: i for i, a in enumerate(symbols)}
+        n, k = len(states), len(symbols)
+        full = np.full((n + 1, k + 1), n, dtype=np.int32)
+        for (q, a), q2 in delta.items():
+            if q2 is None or a not in symbol_index: continue
+            full[index[q], symbol_index[a]] = index[q2]
+        final = np.zeros(n + 1, dtype=bool)
+        for q in F:
+            final[index[q]] = True
+        self._setup(states, symbols, full, final)
+
+    @classmethod
+    def from_tables(cls, symbols: list, full: 'np.ndarray', final: 'np.ndarray', states: list|None=None, rows: bool=True) -> 'compiled_dfa':
+        """compiled_dfa over existing arrays (e.g. views of shared memory or a memmap), without copying them.
+        With rows=False, single-word runs index the NumPy table instead of a list copy of it."""
+        self = object.__new__(cls)
+        self._setup(list(range(full.shape[0] - 1)) if states is None else states, list(symbols), full, final, rows)
+        return self
+
+    def _setup(self, states: list, symbols: list, full: 'np.ndarray', final: 'np.ndarray', rows: bool=True):
+        symbol_index = {a: i for i, a in enumerate(symbols)}
+        n, k = len(states), len(symbols)
+        assert full.shape == (n + 1, k + 1), f'table of shape {full.shape} does not fit {n} states and {k} symbols'
+        # over char_class symbols (see symbolic.py) characters are looked up by the class they are in
+        classes = classifier.of(symbols)
+        if classes is None:
+            byte_index = np.array([symbol_index.get(chr(b), k) for b in range(256)], dtype=np.int32)
+            # code points where the symbol changes, and the symbol from there on (k for none): single-character
+            # symbols are intervals of one, so str batches map to symbol indices by one vectorized search
+            chars = sorted((ord(a), i) for a, i in symbol_index.items() if isinstance(a, str) and len(a) == 1)
+            starts, ends = [0], [k]
+            for c, i in chars:
+                if c == starts[-1]: ends[-1] = i
+                else:
+                    starts.append(c)
+                    ends.append(i)
+                starts.append(c + 1)
+                ends.append(k)
+            codes, code_symbols = np.array(starts, dtype=np.uint32), np.array(ends, dtype=np.int32)
+        else:
+            byte_index = classes.byte_table(k)
+            codes, code_symbols = classes.code_table(k)
+        for arr in (full, final, byte_index, codes, code_symbols):
+            arr.flags.writeable = False
+        self.states, self.index = tuple(states), {q: i for i, q in enumerate(states)}
+        self.symbols, self.symbol_index, self.classes, self.byte_index = tuple(symbols), symbol_index, classes, byte_index
+        self.n, self.k = n, k
+        self.full, self.final = full, final
+        # plain lists are faster than numpy scalar indexing for the one-word-at-a-time path
+        self.rows = full.tolist() if rows else full
+        self._codes, self._code_symbols = codes, code_symbols
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f'compiled_dfa is frozen, cannot set {name}')
+        object.__setattr__(self, name, value)
+
+    @property
+    def table(self):
+        """(|Q|, |A|) transition table with -1 for undefined transitions"""
+        t = self.full[:self.n, :self.k]
+        return np.where(t == self.n, -1, t)
+
+    def _symbols(self, word):
+        if isinstance(word, (bytes, bytearray, memoryview)):
+            return self.byte_index[np.frombuffer(word, dtype=np.uint8)].tolist()
+        if self.classes is not None:
+            if not isinstance(word, str): return self.classes.indices(word, self.k)
+            data = np.frombuffer(word.encode('utf-32-le'), dtype=np.uint32)
+            return self._code_symbols[np.searchsorted(self._codes, data, side='right') - 1].tolist()
+        symbol_index, k = self.symbol_index, self.k
+        return [symbol_index.get(a, k) for a in word]
+
+    def run(self, word, q: int=0) -> int:
+        """index of the state reached on word from q (default: the start state); |Q| if the run dies"""
+        rows, dead = self.rows, self.n
+        if q == dead: return q
+        for a in self._symbols(word):
+            q = rows[q][a]
+            if q == dead: break
+        return q
+
+    def accepts(self, word) -> bool:
+        return bool(self.final[self.run(word)])
+
+    def _batch_symbols(self, words: list):
+        # (len(words), L) array of symbol indices for a bucket of words of the same length L
+        if all(isinstance(w, (bytes, bytearray, memoryview)) for w in words):
+            data = np.frombuffer(b''.join(words), dtype=np.uint8)
+            return self.byte_index[data].reshape(len(words), -1)
+        if all(isinstance(w, str) for w in words):
+            data = np.frombuffer(''.join(words).encode('utf-32-le'), dtype=np.uint32)
+            syms = self._code_symbols[np.searchsorted(self._codes, data, side='right') - 1]
+            return syms.reshape(len(words), -1)
+        return np.array([self._symbols(w) for w in words], dtype=np.int32).reshape(len(words), -1)
+
+    def accepts_many(self, words) -> 'np.ndarray':
+        """boolean array, in input order, telling which of the words are accepted. Words are bucketed by length
+        and each bucket is run in lockstep, one table lookup per position for the whole bucket."""
+        words = list(words)
+        buckets: dict[int, list[int]] = {}
+        for i, w in enumerate(words):
+            buckets.setdefault(len(w), []).append(i)
+        result = np.zeros(len(words), dtype=bool)
+        for length, ids in buckets.items():
+            syms = self._batch_symbols([words[i] for i in ids])
+            q = np.zeros(len(ids), dtype=np.int32)
+            for j in range(length):
+                q = self.full[q, syms[:, j]]
+            result[ids] = self.final[q]
+        return result
+
+    def matcher(self, record: bool=False, capacity: int=1024) -> 'dfa_matcher':
+        return dfa_matcher(self, record, capacity)
+
+class dfa_matcher:
+    """resumable run of a compiled_dfa over input that arrives in chunks (str or bytes, from a file, socket or generator).
+    Only the current state index is kept, so memory is O(1) per stream. With record=True the state index after every
+    symbol is also written into a preallocated array.array (doubled when full)."""
+    __slots__ = ('M', 'q', 'record', 'trace', 'length')
+
+    def __init__(self, M: compiled_dfa, record: bool=False, capacity: int=1024) -> None:
+        self.M = M
+        self.record = record
+        self.trace = array('i', [0]) * max(1, capacity) if record else None
+        self.reset()
+
+    def reset(self):
+        self.q = 0
+        self.length = 0
+        if self.record: self.trace[0] = 0
+        return self
+
+    def feed(self, chunk):
+        if not self.record:
+            self.q = self.M.run(chunk, self.q)
+            return self
+        rows, dead, q = self.M.rows, self.M.n, self.q
+        trace, i = self.trace, self.length
+        for a in self.M._symbols(chunk):
+            q = rows[q][a] if q != dead else dead
+            i += 1
+            if i == len(trace):
+                trace.extend(trace)
+            trace[i] = q
+        self.q, self.length = q, i
+        return self
+
+    @property
+    def state(self):
+        """label of the current state, or None once the run has died"""
+        return self.M.states[self.q] if self.q < self.M.n else None
+
+    def is_accepting(self) -> bool:
+        return bool(self.M.final[self.q])
+
+    def path(self) -> list:
+        """labels of the states visited so far, starting with the start state (record=True only)"""
+        assert self.record, 'path is only recorded with record=True'
+        return [self.M.states[q] if q < self.M.n else None for q in self.trace[:self.length + 1]]
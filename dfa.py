@@ -1,8 +1,32 @@
-import graphviz as gv
-from automaton import automaton
+import numpy as np
+from automaton import automaton, dfa_delta, profiler, timed, verdict
+from compiled import compiled_dfa
+from incremental import tracker
+import parallel
+import render
+import symbolic
 from typing import Any
+from collections import deque
+from random import Random
+
+def _representative(cls: list):
+    # smallest label of the class when labels are comparable (e.g. product tuples with None are not)
+    try:
+        return min(cls)
+    except TypeError:
+        return cls[0]
+
+def _joined(symbols: list):
+    # a word as a string when its symbols are strings, as a tuple of them otherwise
+    return ''.join(symbols) if all(isinstance(a, str) for a in symbols) else tuple(symbols)
 
 class dfa(automaton):
+    delta_type = dfa_delta
+    # the incremental tracker of reachability and equivalence classes, while incremental mode is on
+    tracker = None
+    # (version, Q_0, compiled_dfa) of the last compile
+    _compiled = None
+
     def __init__(self, Q: set|list|int, A: set|list|int, Q_0: Any, F: set|list|str, name:str|None=None) -> None:
         super().__init__(Q, A, F, name)
         # self.Q_0 = self.Q[Q_0] if isinstance(Q_0, int) else Q_0
@@ -10,180 +34,564 @@ class dfa(automaton):
         assert self.Q_0 in self.Q, f'Q_0 = {self.Q_0} not in Q = {self.Q}'
 
     def add_vertex(self, name=None, final=False):
+        t = self.tracker
+        if t is not None: t.vertex(name, final)
         self.Q.add(name) 
         if final: self.F.add(name)
+        if t is not None: t.synced()
     
     def add_edge(self, q1, q2, a):
         assert q1 in self.Q, f'q1 = {q1} not in Q = {self.Q}'
         assert q2 in self.Q, f'q2 = {q2} not in Q = {self.Q}'
         assert a in self.A, f'a = {a} not in A = {self.A}'
+        t = self.tracker
+        if t is not None: t.edge(q1, a, self.delta.get((q1, a)), q2)
         self.delta[(q1, a)] = q2
+        if t is not None: t.synced()
     
     def remove_vertex(self, q):
-        if q not in self.Q: return
-        assert q != self.Q_0, f'q = {q} is the start state, cannot remove it'
-        self.Q.remove(q)
-        self.F.discard(q)
-        for a in self.A:
-            self.delta.pop((q, a), None)
-        for (q1, a), q2 in self.delta.copy().items():
-            if q2 == q:
-                self.delta.pop((q1, a))
-        
+        self.remove_vertices([q])
+
+    def remove_vertices(self, qs):
+        """remove the states qs and every transition from or into them, in one pass over delta"""
+        ids = self.states.ids
+        t = self.tracker
+        if t is not None:
+            qs = set(q for q in qs if q in self.Q)
+            assert self.Q_0 not in qs, f'q = {self.Q_0} is the start state, cannot remove it'
+            t.remove(qs)
+        drop = set()
+        for q in qs:
+            if q not in self.Q: continue
+            assert q != self.Q_0, f'q = {q} is the start state, cannot remove it'
+            self.Q.remove(q)
+            self.F.discard(q)
+            drop.add(ids[q])
+        if not drop: return self
+        self.delta.drop(drop)
+        for i in drop:
+            self.states.release(self.states.items[i])
+        if t is not None: t.synced()
+        return self
+
     def remove_edge(self, q, a):
         assert q in self.Q, f'q = {q} not in Q = {self.Q}'
         assert a in self.A, f'a = {a} not in A = {self.A}'
+        t = self.tracker
+        if t is not None: t.edge(q, a, self.delta[(q, a)], None)
         self.delta.pop((q, a))
+        if t is not None: t.synced()
 
-    def draw(self, savefig=False, directory=None, filename=None):
-        def _format(q):
-            if isinstance(q, frozenset):
-                return str(set(q)) if q != frozenset() else 'ø'
-            return str(q)
-        fig = gv.Digraph(self.name, format='png')
-        status = {q: False for q in self.Q}
-        q = self.Q_0
-        fig.node(_format(q), shape='circle', color='red')
-        status[q] = True
-        for q in self.F:
-            if status[q]:
-                fig.node(_format(q), shape='doublecircle', color='red')
-            else:
-                fig.node(_format(q), shape='doublecircle')
-            status[q] = True
-        for q in self.Q:
-            if status[q]: continue
-            fig.node(_format(q), shape='circle')
-
-        # edges
-        for (q1, a), q2 in self.delta.items():
-            if q2 is None: continue
-            fig.edge(_format(q1), _format(q2), label=a)
-        fig.graph_attr['rankdir'] = 'LR'
-        fig.graph_attr['size'] = '10'
-        if savefig:
-            fig.render(filename if filename else self.name, directory=directory, view=False)
-        return fig
+    def draw(self, savefig=False, directory=None, filename=None, compact: bool|None=None, around=None, hops: int=2,
+             engine: str|None=None):
+        """Graphviz drawing of the dfa; compact, around and hops give smaller drawings of large ones (see render.py)"""
+        delta, symbols = self.delta.expand(), sorted(self.A, key=str)
+        def successors(q):
+            for a in symbols:
+                t = delta.get((q, a))
+                if t is not None: yield a, t
+        return render.draw(self, set([self.Q_0]), successors, savefig, directory, filename, compact, around, hops, engine)
     
     def run(self, word: str):
+        classes = self.symbol_classes()
+        if classes is not None: word = classes.classify(word)
         q = self.Q_0
-        path = f'{q}'
+        path = [q]
         for a in word:
-            if (q, a) not in self.delta: return path, False
+            if (q, a) not in self.delta: return ' -> '.join(map(str, path)), False
             q = self.delta[(q, a)]
-            path += f' -> {q}'
-        return path, (q in self.F)
+            path.append(q)
+        return ' -> '.join(map(str, path)), (q in self.F)
+
+    def accepts_parallel(self, words, workers: int|None=None, chunksize: int=4096, ordered: bool=True):
+        """accepts over many words on a process pool sharing one compiled table (see parallel.accepts_parallel)"""
+        return parallel.accepts_parallel(self.compile(), words, workers, chunksize, ordered)
+
+    def matcher(self, record: bool=False, capacity: int=1024):
+        """streaming matcher over chunked input (see compiled.dfa_matcher), on a compiled copy of this dfa"""
+        return self.compile().matcher(record, capacity)
     
     def extended_delta(self, X: set, word: str):
         # convention
         if len(X) == 0: return X
         
-        # basecase
-        if len(word) == 0: return X
-        
-        # inductive step
-        X1 = set(self.delta[(q, word[0])] for q in X if (q, word[0]) in self.delta)
-        return self.extended_delta(X1, word[1:])
+        # D(X, aw) = D(D(X, a), w), as a loop over the word
+        for a in word:
+            X = set(self.delta[(q, a)] for q in X if (q, a) in self.delta)
+            if len(X) == 0: break
+        return X
     
     def accepts(self, word: str):
-        return self.extended_delta({self.Q_0}, word) & self.F != set()
+        p = profiler.active
+        if p is not None:
+            p.count('accepts.calls')
+            p.count('accepts.symbols', len(word))
+        classes = self.symbol_classes()
+        if classes is not None: word = classes.classify(word)
+        # the run goes over the interned ids in the rows of delta
+        s = self.delta.walk(self.states.ids[self.Q_0], word)
+        return s >= 0 and self.states.items[s] in self.F
+
+    def compile(self):
+        """frozen table-driven matcher for this dfa (see compiled.compiled_dfa), reused until the dfa is edited"""
+        cached = self._compiled
+        if cached is not None and cached[0] == self.version and cached[1] == self.Q_0: return cached[2]
+        # a lazy dfa is completed first, which changes its version, so the cache is checked again
+        self.delta.expand()
+        cached = self._compiled
+        if cached is not None and cached[0] == self.version and cached[1] == self.Q_0: return cached[2]
+        with timed('dfa.compile'):
+            C = compiled_dfa(self.Q, self.A, self.Q_0, self.F, self.delta)
+        self._compiled = (self.version, self.Q_0, C)
+        return C
     
     def union(self, other: 'dfa'):
-        return self.join(other, lambda x, y: x or y)
+        return self.join(other, lambda x, y: x or y, name=f'{self.name} union {other.name}')
     
     def intersect(self, other: 'dfa'):
-        return self.join(other, lambda x, y: x and y)
+        return self.join(other, lambda x, y: x and y, name=f'{self.name} intersect {other.name}')
     
-    def join(self, other: 'dfa', accept_cn: Any):
+    def join(self, other: 'dfa', accept_cn: Any, name: str|None=None):
         """compute the cross product of two DFAs, and accept_cn is a function (q in F, q' in F) -> bool that tells whether the pair (q, q') is accepted (True) or not (False)"""
-        assert self.A == other.A, f'A = {self.A} != A = {other.A}'
-        
-        Q = set()
-        for q1 in self.Q:
-            for q2 in other.Q:
-                Q.add(frozenset([q1, q2]))
-        Q_0 = frozenset([self.Q_0, other.Q_0])
-        F = set()
-        for q1 in self.Q:
-            for q2 in other.Q:
-                if accept_cn(q1 in self.F, q2 in other.F):
-                    F.add(frozenset([q1, q2]))
-
-        M = dfa(Q, self.A, self.Q_0, self.F, name=f'{self.name} union {other.name}')
-        for a in self.A:
-            for q1 in self.Q:
-                for q2 in other.Q:
-                    if (q1, a) in self.delta and (q2, a) in other.delta:
-                        M.add_edge(frozenset([q1, q2]), frozenset([self.delta[(q1, a)], other.delta[(q2, a)]]), a)
-        return M
+        return dfa.product([self, other], lambda bits: accept_cn(*bits), name=name if name else f'{self.name} x {other.name}')
+
+    @staticmethod
+    def _product_step(automata: list['dfa'], qs: tuple, a):
+        # a component with no transition on a drops to None, a dead state that is never accepting
+        qs2 = tuple(M.delta[(q, a)] if q is not None and (q, a) in M.delta else None for M, q in zip(automata, qs))
+        return None if all(q is None for q in qs2) else qs2
+
+    @staticmethod
+    def _product_accepts(automata: list['dfa'], qs: tuple, accept_cn: Any):
+        return accept_cn(tuple(q is not None and q in M.F for M, q in zip(automata, qs)))
+
+    @staticmethod
+    def product(automata: list['dfa'], accept_cn: Any, name: str|None=None):
+        """n-ary cross product, built by BFS from (Q_0, Q_0', ...) so only the reachable tuples of states are created.
+        accept_cn maps the tuple of bits (q in F, q' in F, ...) to whether the tuple (q, q', ...) is accepted,
+        e.g. all for the intersection and any for the union."""
+        A = automata[0].A
+        if any(M.A != A for M in automata) and all(M.symbol_classes() is not None for M in automata):
+            # char_class alphabets are refined to one partition first
+            automata = symbolic.align(automata)
+            A = automata[0].A
+        assert all(M.A == A for M in automata), f'automata have different alphabets: {[M.A for M in automata]}'
+        start = tuple(M.Q_0 for M in automata)
+        F = set([start]) if dfa._product_accepts(automata, start, accept_cn) else set()
+        P = dfa(set([start]), set(A), start, F, name=name if name else ' x '.join(M.name for M in automata))
+        p = profiler.active
+        queue = deque([start])
+        with timed('dfa.product'):
+            while queue:
+                qs = queue.popleft()
+                if p is not None: p.count('product.transitions', len(A))
+                for a in A:
+                    qs2 = dfa._product_step(automata, qs, a)
+                    if qs2 is None: continue
+                    if qs2 not in P.Q:
+                        P.add_vertex(qs2, final=dfa._product_accepts(automata, qs2, accept_cn))
+                        queue.append(qs2)
+                        if p is not None:
+                            p.count('product.states')
+                            p.tick('product', len(P.Q))
+                    P.delta[(qs, a)] = qs2
+        return P
+
+    @staticmethod
+    def product_witness(automata: list['dfa'], accept_cn: Any, A: set|None=None):
+        """shortest word leading the product of automata to an accepted tuple, or None if there is none. The search
+        stops at the first accepted tuple without building the product, e.g. L(M1) is a subset of L(M2) iff
+        product_witness([M1, M2], lambda bits: bits[0] and not bits[1]) is None. The words are over A, by default
+        the common alphabet of the automata; a symbol outside the alphabet of one of them kills that component."""
+        if A is None:
+            A = automata[0].A
+            assert all(M.A == A for M in automata), f'automata have different alphabets: {[M.A for M in automata]}'
+        start = tuple(M.Q_0 for M in automata)
+        parent = {start: None}
+        queue = deque([start])
+        while queue:
+            qs = queue.popleft()
+            if dfa._product_accepts(automata, qs, accept_cn):
+                word = []
+                while parent[qs] is not None:
+                    qs, a = parent[qs]
+                    word.append(a)
+                return ''.join(reversed(word))
+            for a in A:
+                qs2 = dfa._product_step(automata, qs, a)
+                if qs2 is None or qs2 in parent: continue
+                parent[qs2] = (qs, a)
+                queue.append(qs2)
+        return None
     
     def complement(self):
-        return dfa(self.Q, self.A, self.Q_0, self.Q.difference(self.F), name=f'{self.name}.complement')
+        # a copy with F flipped, completed first: missing transitions go to a new dead state, which is accepting
+        # in the complement
+        self.delta.expand()
+        M = dfa(self.Q, self.A, self.Q_0, self.Q.difference(self.F), name=f'{self.name}.complement')
+        M.delta = self.delta.copy()
+        if len(M.delta) < len(self.Q) * len(self.A):
+            dead = 'dead'
+            while dead in M.Q: dead += "'"
+            M.add_vertex(dead, final=True)
+            for q in M.Q:
+                for a in M.A:
+                    if (q, a) not in M.delta: M.delta[(q, a)] = dead
+        return M
+
+    def to_nfa(self):
+        from nfa import nfa
+        self.delta.expand()
+        M = nfa(set(self.Q), set(self.A), set([self.Q_0]), set(self.F), name=self.name + '.nfa')
+        for (q, a), q2 in self.delta.items():
+            M.delta.add(q, a, q2)
+        return M
+
+    # Decision procedures. Against another dfa they search the product breadth-first (dfa.product_witness), so the
+    # counterexamples are shortest; equivalence is decided by Hopcroft and Karp's union-find first. Against an nfa
+    # they go through nfa's antichain algorithms.
+
+    def is_empty(self) -> verdict:
+        w = dfa.product_witness([self], lambda bits: bits[0])
+        return verdict(w is None, w)
+
+    def is_universal(self) -> verdict:
+        w = dfa.product_witness([self.complement()], lambda bits: bits[0])
+        return verdict(w is None, w)
+
+    def includes(self, other) -> verdict:
+        """whether L(other) is a subset of L(self); if not, the counterexample is in L(other) but not in L(self)"""
+        if not isinstance(other, dfa): return self.to_nfa().includes(other)
+        w = dfa.product_witness([self, other], lambda bits: bits[1] and not bits[0], self.A | other.A)
+        return verdict(w is None, w)
+
+    def equivalent(self, other) -> verdict:
+        """whether L(self) = L(other); if not, the counterexample is in exactly one of them"""
+        if not isinstance(other, dfa): return self.to_nfa().equivalent(other)
+        # Hopcroft-Karp: merge the start states and, breadth-first, the successors of merged pairs, in a union-find
+        # over the states of both (None is the dead state, shared); a merged pair that disagrees on acceptance
+        # means the languages differ, and the product search then finds a shortest word telling them apart
+        A = self.A | other.A
+        parent = {}
+        def find(x):
+            root = x
+            while parent.get(root, root) != root: root = parent[root]
+            while x != root: parent[x], x = root, parent.get(x, x)
+            return root
+        start = ((0, self.Q_0), (1, other.Q_0))
+        parent[find(start[0])] = find(start[1])
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            if (x is not None and x[1] in self.F) != (y is not None and y[1] in other.F):
+                w = dfa.product_witness([self, other], lambda bits: bits[0] != bits[1], A)
+                return verdict(False, w)
+            for a in A:
+                x2 = (0, self.delta[(x[1], a)]) if x is not None and (x[1], a) in self.delta else None
+                y2 = (1, other.delta[(y[1], a)]) if y is not None and (y[1], a) in other.delta else None
+                rx, ry = find(x2), find(y2)
+                if rx != ry:
+                    parent[rx] = ry
+                    queue.append((x2, y2))
+        return verdict(True)
     
+    def reverse(self):
+        """nfa for the reversed language: every edge flipped, started in F and accepting in Q_0"""
+        from nfa import nfa
+        self.delta.expand()
+        M = nfa(set(self.Q), set(self.A), set(self.F), set([self.Q_0]), name=self.name + '.reverse')
+        for (q, a), q2 in self.delta.items():
+            M.add_edge(q2, q, a)
+        return M
+
+    def _counting(self, n: int, modulus: int|None):
+        # compiled successor table (start state 0, |Q| where the run dies) and the dtype the counts fit in: int64 when
+        # they stay below 2^62 (words of length <= n over A number at most (n+1) |A|^n), or when sums of |A| residues
+        # do; Python ints otherwise
+        C = self.compile()
+        if modulus is not None:
+            assert modulus > 0, f'modulus = {modulus} is not positive'
+            fits = (modulus - 1) * (C.k + 1) < 2 ** 63
+        else:
+            fits = n * np.log2(max(C.k, 2)) + np.log2(n + 2) < 62
+        return C, C.full[:C.n, :C.k], np.int64 if fits else object
+
+    @staticmethod
+    def _step_counts(succ, v, modulus: int|None):
+        # v'[q] = sum over a of v[delta(q, a)]: the counts one symbol further back; the dead state counts 0
+        v = np.append(v, 0)[succ].sum(axis=1)
+        return v % modulus if modulus is not None else v
+
+    def _matrix_counts(self, n: int, modulus: int|None, up_to: bool):
+        C, succ, dtype = self._counting(n, modulus)
+        q, k = C.n, C.k
+        final = C.final[:q].astype(dtype)
+        # one step over the table costs |Q| |A|, one squaring of the transfer matrix |Q|^3: square only when the
+        # log n squarings are cheaper than the n steps
+        if n * k <= n.bit_length() * q * q:
+            v, total = final, final.copy()
+            for _ in range(n):
+                v = self._step_counts(succ, v, modulus)
+                total = total + v if up_to else v
+            return int(total[0] % modulus if modulus is not None else total[0])
+        # transfer matrix T[p, r] = number of symbols leading from p to r, so T^n f counts the words of length n. For
+        # the counts up to n, the block matrix [[T, f], [0, 1]] to the power n+1 has the sum of T^i f for i <= n as
+        # its last column
+        size = q + 1 if up_to else q
+        if modulus is not None and (modulus - 1) ** 2 * (size + 1) >= 2 ** 63: dtype = object
+        final = final.astype(dtype)
+        T = np.zeros((size, size), dtype=dtype)
+        live = succ < q
+        np.add.at(T, (np.nonzero(live)[0], succ[live]), 1)
+        if up_to:
+            T[:q, q] = final
+            T[q, q] = 1
+            v, e = np.zeros(size, dtype=dtype), n + 1
+            v[q] = 1
+        else:
+            v, e = final, n
+        while e:
+            # repeated squaring: v = T^(bits of e so far) v
+            if e & 1:
+                v = T @ v
+                if modulus is not None: v %= modulus
+            e >>= 1
+            if e:
+                T = T @ T
+                if modulus is not None: T %= modulus
+        return int(v[0])
+
+    def count_words(self, n: int, modulus: int|None=None) -> int:
+        """number of accepted words of length n, exact or modulo modulus"""
+        return self._matrix_counts(n, modulus, up_to=False)
+
+    def count_up_to(self, n: int, modulus: int|None=None) -> int:
+        """number of accepted words of length at most n, exact or modulo modulus"""
+        return self._matrix_counts(n, modulus, up_to=True)
+
+    def _suffix_counts(self, n: int):
+        # S[i][p] = number of words of length i accepted from state p, for i = 0..n, with a 0 for the dead state
+        C, succ, dtype = self._counting(n, None)
+        S = [np.append(C.final[:C.n].astype(dtype), 0)]
+        for _ in range(n):
+            S.append(np.append(self._step_counts(succ, S[-1][:-1], None), 0))
+        return C, succ, S
+
+    def sample(self, n: int, k: int, seed: int|None=None) -> list:
+        """k accepted words of length n drawn uniformly at random (independently, so possibly repeated); [] if there
+        are none. Words over single-character symbols are strings, other words tuples."""
+        C, succ, S = self._suffix_counts(n)
+        if not S[n][0]: return []
+        rng = Random(seed)
+        symbols = sorted(range(C.k), key=lambda a: str(C.symbols[a]))
+        succ = succ[:, symbols]
+        if S[n].dtype == object:
+            words = []
+            for _ in range(k):
+                # walk from the start state, taking each symbol with probability proportional to its suffix count
+                p, word = 0, []
+                for i in range(n, 0, -1):
+                    r = rng.randrange(S[i][p])
+                    for a, t in enumerate(succ[p]):
+                        r -= S[i - 1][t]
+                        if r < 0: break
+                    word.append(C.symbols[symbols[a]])
+                    p = t
+                words.append(word)
+            return [_joined(w) for w in words]
+        # all k walks advance together: cumulative suffix counts per walk, one uniform draw each
+        gen = np.random.default_rng(rng.getrandbits(64))
+        p = np.zeros(k, dtype=np.int64)
+        picks = np.empty((k, n), dtype=np.int64)
+        for i in range(n, 0, -1):
+            cum = np.cumsum(S[i - 1][succ[p]], axis=1)
+            r = gen.integers(0, cum[:, -1])
+            a = (cum <= r[:, None]).sum(axis=1)
+            picks[:, n - i] = a
+            p = succ[p, a]
+        labels = [C.symbols[a] for a in symbols]
+        return [_joined([labels[a] for a in row]) for row in picks.tolist()]
+
+    def enumerate(self, n: int):
+        """the accepted words of length n, lazily in lexicographic order of the symbols (compared as strings)"""
+        C = self.compile()
+        symbols = sorted(range(C.k), key=lambda a: str(C.symbols[a]))
+        succ = C.full[:C.n, symbols]
+        # live[i][p]: some word of length i is accepted from p (the dead state is never live)
+        live = [np.append(C.final[:C.n], False)]
+        for _ in range(n):
+            live.append(np.append(live[-1][succ].any(axis=1), False))
+        live = [row.tolist() for row in live]
+        succ = succ.tolist()
+        labels = [C.symbols[a] for a in symbols]
+        if not live[n][0]: return
+        # depth-first over the symbols in order, entering only states with accepted suffixes of the remaining length
+        word, stack = [], [(0, iter(range(len(labels))))]
+        while stack:
+            p, choices = stack[-1]
+            remaining = n - len(word)
+            if remaining == 0: yield _joined(word)
+            else:
+                for a in choices:
+                    t = succ[p][a]
+                    if live[remaining - 1][t]:
+                        word.append(labels[a])
+                        stack.append((t, iter(range(len(labels)))))
+                        break
+                else: remaining = 0
+            if remaining == 0:
+                # done below this prefix: back up one symbol
+                stack.pop()
+                if word: word.pop()
+
     def remove_unreachable_states(self):
-        visited = set([self.Q_0])
-        def dfs_recursive(q):
-            for a in self.A:
-                if (q, a) not in self.delta: continue
-                q_ = self.delta[(q, a)]
-                if q_ not in visited:
-                    visited.add(q_)
-                    dfs_recursive(q_)
-        dfs_recursive(self.Q_0)
-        unreachable = self.Q.difference(visited)
-        for q in unreachable:
-            self.remove_vertex(q)
-        return self
+        if self.tracker is not None:
+            reach = self.tracker.update().reach
+            return self.remove_vertices([q for q in self.Q if q not in reach])
+        # breadth-first search from Q_0 over the id rows of delta, then one bulk removal
+        ids, rows = self.states.ids, self.delta.expand().rows
+        seen = bytearray(len(self.states))
+        seen[ids[self.Q_0]] = 1
+        queue = [ids[self.Q_0]]
+        for s in queue:
+            for row in rows:
+                t = row[s] if s < len(row) else -1
+                if t >= 0 and not seen[t]:
+                    seen[t] = 1
+                    queue.append(t)
+        return self.remove_vertices([q for q in self.Q if not seen[ids[q]]])
+
+    def remove_dead_states(self):
+        """remove the states other than Q_0 from which F cannot be reached (the dfa may become partial)"""
+        # breadth-first search back from F over an index of the reversed edges
+        ids = self.states.ids
+        rev = {}
+        for s, _, t in self.delta.edges():
+            rev.setdefault(t, []).append(s)
+        live = bytearray(len(self.states))
+        queue = [ids[q] for q in self.F]
+        for t in queue: live[t] = 1
+        for t in queue:
+            for s in rev.get(t, ()):
+                if not live[s]:
+                    live[s] = 1
+                    queue.append(s)
+        return self.remove_vertices([q for q in self.Q if not live[ids[q]] and q != self.Q_0])
+
+    def trim(self):
+        """keep only the states on some path from Q_0 to F (and Q_0)"""
+        return self.remove_unreachable_states().remove_dead_states()
     
-    def get_equivalence_classes(self):
-        # Hopcroft'71
+    def get_equivalence_classes(self, distinct=()):
+        # Hopcroft'71 partition refinement, O(|Q||A| log |Q|), in Valmari and Lehtinen's form for partial
+        # transition functions: every initial block starts out as a splitter, after which only the smaller
+        # half of each split needs to be queued. States that cannot reach F are equivalent to a missing
+        # transition, so they are kept out of the refinement and returned as one class of their own.
+        # The states in distinct (whose edges are not known yet, in an automaton still being built) each start
+        # in a block of their own and count as able to reach F.
+        self.delta.expand()
         Q_lst = list(self.Q)
-        # initially, all unmarked
-        table = {(Q_lst[i],Q_lst[j]):True for i in range(len(Q_lst)-1) for j in range(i+1, len(Q_lst))}
-        # print(table)
-        # print(Q_lst)
-        # mark all states, one in F one not in F:
-        modified = False
-        for (q1, q2) in table:
-            if (q1 in self.F) != (q2 in self.F):
-                table[(q1, q2)] = False
-                modified = True
-
-        while modified:
-            modified = False
-            for (q1, q2) in table:
-                if not table[(q1, q2)]: continue
-                for a in self.A:
-                    if (q1, a) not in self.delta or (q2, a) not in self.delta: continue
-                    q1_ = self.delta[(q1, a)]
-                    q2_ = self.delta[(q2, a)]
-                    if q1_ == q2_: continue
-                    if (q1_, q2_) in table and table[(q1_, q2_)]: continue
-                    if (q2_, q1_) in table and table[(q2_, q1_)]: continue
-                    else:
-                        table[(q1, q2)] = False
-                        modified = True
-                        break # don't need to check other a's
-        # print(table)
-        # now to make the classes
-        classes: list[list] = []
-        for q in self.Q:
-            for cls in classes:
-                elem = cls[0]
-                if (q, elem) in table and table[(q, elem)]: 
-                    cls.append(q)
-                    break
-                elif (elem, q) in table and table[(elem, q)]:
-                    cls.append(q)
-                    break
-            else:
-                classes.append([q])
+        index = {self.states.ids[q]: i for i, q in enumerate(Q_lst)}
+        A_lst = list(self.A)
+        n, k = len(Q_lst), len(A_lst)
+        sym = {self.symbols.ids[a]: i for i, a in enumerate(A_lst) if a in self.symbols.ids}
+
+        # inverse transitions, and the states that can reach F (backward search from F), read off the id rows of delta
+        rev = [[] for _ in range(n)]
+        edges = []
+        for s, b, t in self.delta.edges():
+            s, t = index[s], index[t]
+            rev[t].append(s)
+            edges.append((s, sym[b], t))
+        live = [False] * n
+        distinct = set(index[self.states.ids[q]] for q in distinct)
+        stack = [index[self.states.ids[q]] for q in self.F] + list(distinct)
+        for t in stack: live[t] = True
+        while stack:
+            t = stack.pop()
+            for s in rev[t]:
+                if not live[s]:
+                    live[s] = True
+                    stack.append(s)
+        inv = [[[] for _ in range(n)] for _ in range(k)]
+        for s, a, t in edges:
+            if live[s] and live[t]:
+                inv[a][t].append(s)
+
+        blocks: list[set] = []
+        block_of = [-1] * n
+        for init in [set([i]) for i in distinct] + [set(i for i in range(n) if live[i] and i not in distinct and Q_lst[i] in self.F),
+                                                     set(i for i in range(n) if live[i] and i not in distinct and Q_lst[i] not in self.F)]:
+            if not init: continue
+            for i in init: block_of[i] = len(blocks)
+            blocks.append(init)
+        waiting = deque((B, a) for B in range(len(blocks)) for a in range(k))
+        in_waiting = set(waiting)
+        p = profiler.active
+        rounds = 0
+        while waiting:
+            splitter = waiting.popleft()
+            in_waiting.discard(splitter)
+            if p is not None:
+                rounds += 1
+                p.count('refine.splitters')
+                p.tick('refine', rounds)
+            B, a = splitter
+            # group the a-predecessors of B by the block they are in
+            touched: dict[int, list] = {}
+            for t in blocks[B]:
+                for s in inv[a][t]:
+                    touched.setdefault(block_of[s], []).append(s)
+            for C, members in touched.items():
+                if len(members) == len(blocks[C]): continue
+                # split C, moving out whichever part is smaller; that part becomes the new block
+                if 2 * len(members) <= len(blocks[C]):
+                    moved = set(members)
+                else:
+                    members = set(members)
+                    moved = set(s for s in blocks[C] if s not in members)
+                blocks[C] -= moved
+                if p is not None: p.count('refine.splits')
+                N = len(blocks)
+                blocks.append(moved)
+                for s in moved: block_of[s] = N
+                for b in range(k):
+                    if (N, b) not in in_waiting:
+                        in_waiting.add((N, b))
+                        waiting.append((N, b))
+
+        classes: list[list] = [[Q_lst[i] for i in block] for block in blocks]
+        dead = [Q_lst[i] for i in range(n) if not live[i]]
+        if dead: classes.append(dead)
         return classes
     
     def minimize(self):
-        classes = self.remove_unreachable_states().get_equivalence_classes()
+        with timed('dfa.minimize'):
+            return self._minimize()
+
+    def incremental(self, on: bool=True):
+        """turn incremental mode on (or off with on=False). While it is on, edits made through add_edge,
+        remove_edge, add_vertex and remove_vertex(ices) keep a tracker of the reachable states and of the classes
+        of equivalent states up to date, locally around the edits, for minimized_view and remove_unreachable_states
+        to read off. Returns the tracker (see incremental.py)."""
+        self.tracker = tracker(self) if on else None
+        return self.tracker
+
+    def minimized_view(self):
+        """the minimal dfa of this one, as a new dfa; unlike minimize, this one is left as it is"""
+        if self.tracker is not None: return self.tracker.view()
+        self.delta.expand()
+        D = dfa(set(self.Q), set(self.A), self.Q_0, set(self.F), name=self.name + '.minimized')
+        D.delta = self.delta.copy()
+        return D.minimize()
+
+    def _minimize(self):
+        with timed('minimize.remove_unreachable_states'):
+            self.remove_unreachable_states()
+        with timed('minimize.refine'):
+            classes = self.get_equivalence_classes()
         elem_to_class = {elem: i for i,cls in enumerate(classes) for elem in cls}
-        min_elem_per_class = [min(cls) for cls in classes]
+        min_elem_per_class = [_representative(cls) for cls in classes]
 
         self.Q = self._format(min_elem_per_class)
         
@@ -197,16 +605,38 @@ class dfa(automaton):
         assert self.Q_0 in self.Q, f'Q_0 = {self.Q_0} not in Q = {self.Q}'
         # assert self.F.issubset(self.Q), f'F = {self.F} not in Q = {self.Q}'
         delta = {}
-        
-        for q in self.Q:
-            for a in self.A:
-                q2 = self.delta[(q, a)]
+        for (q, a), q2 in self.delta.items():
+            if q in self.Q:
                 delta[(q, a)] = min_elem_per_class[elem_to_class[q2]]
         self.delta = delta
         return self
     
+    def _merge_equivalent(self, distinct: set) -> dict:
+        # merge the equivalent states of this (partial) dfa in place, keeping each state of distinct apart from all
+        # others; the merged states are dropped from the label table. Returns {id of a merged state: id of the
+        # state it was merged into}.
+        merged = {}
+        for cls in self.get_equivalence_classes(distinct):
+            rep = self.Q_0 if self.Q_0 in cls else cls[0]
+            for q in cls:
+                if q != rep: merged[q] = rep
+        if not merged: return {}
+        delta = {}
+        for (q, a), q2 in self.delta.items():
+            if q not in merged: delta[(q, a)] = merged.get(q2, q2)
+        for q in merged:
+            self.Q.discard(q)
+            self.F.discard(q)
+        self.delta = delta
+        ids = self.states.ids
+        merged_ids = {ids[q]: ids[rep] for q, rep in merged.items()}
+        for q in merged:
+            self.states.release(q)
+        return merged_ids
+
     def relabel(self):
         # relabel Q to {0, 1, 2, ...Q-1}
+        self.delta.expand()
         relabel_map = {self.Q_0: 0}
         for i, q in enumerate(self.Q):
             if q == self.Q_0: continue
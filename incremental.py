@@ -0,0 +1,343 @@
+# Incremental maintenance of a dfa under edits (see dfa.incremental). The tracker keeps
+# - reach, the states reachable from Q_0, and live, the states that can reach F;
+# - the partition of the reachable states into classes of equal right language, i.e. the states of the minimal dfa,
+#   with the reachable states that are not live all in one dead class;
+# - the signature of every live class: (final, class of the successor on each symbol), with None for a missing or
+#   dead successor. All members of a class have its signature. It carries the finality of each successor as well,
+#   which the successor classes determine: states of one class all have the same finality, as long as F is not
+#   edited (which makes the tracker start over).
+#
+# The dfa reports each edit before making it; the tracker notes it and settles all pending edits at the next query.
+# Settling first updates reach and live by searching from the ends of the edited edges only. Then the states whose
+# signature may have changed are checked, class by class: when all the checked members of a class moved the same way,
+# the class keeps its id and only its signature changes, so nothing upstream of it has to be looked at; members that
+# part from the rest move to a new class and have their predecessors checked. This only ever splits classes, so it
+# ends. Classes whose languages became equal are then found among those whose signature changed: each is tested
+# against the classes of its shape with a Hopcroft-Karp bisimulation check, merged where that succeeds, and the
+# merge is settled in turn.
+# Settling that would touch more than rebuild_share of the reachable states, or edits made behind the tracker's back
+# (its version no longer that of the dfa, or a new Q_0), make it start over with Hopcroft's refinement instead.
+
+class tracker:
+    """reachable states and equivalence classes of a dfa, kept up to date under its edits"""
+    rebuild_share = 0.5
+
+    def __init__(self, M) -> None:
+        self.M = M
+        self.rebuilds = 0
+        self.rebuild()
+
+    def rebuild(self):
+        M = self.M
+        self.symbols = tuple(M.A)
+        self.preds = {}
+        for (q, a), t in M.delta.items():
+            self.preds.setdefault(t, set()).add((q, a))
+        self.reach, self.live = set(), set()
+        self._forward([M.Q_0], self.reach)
+        self._backward(list(M.F), self.live)
+        self.cls, self.members, self.sig, self.shapes = {}, {}, {}, {}
+        self.dead = None
+        self.next_id = 0
+        for cls in M.get_equivalence_classes():
+            cls = [q for q in cls if q in self.reach]
+            if not cls: continue
+            c = self._new_class(cls)
+            if cls[0] not in self.live: self.dead = c
+        for c in list(self.members):
+            if c != self.dead: self._set_sig(c, self._sig_of(next(iter(self.members[c]))))
+        self.dirty, self.cut, self.queue = set(), set(), set()
+        self.version, self.start, self.stale = M.version, M.Q_0, False
+        self.rebuilds += 1
+        return self
+
+    # searches
+
+    def _successors(self, q):
+        delta = self.M.delta
+        for a in self.symbols:
+            t = delta.get((q, a))
+            if t is not None: yield t
+
+    def _forward(self, roots, seen: set, within: set|None=None) -> set:
+        # the states reachable from roots that are not in seen (and are in within, if given); adds them to seen
+        queue = [q for q in set(roots) if q not in seen and (within is None or q in within)]
+        seen.update(queue)
+        for q in queue:
+            for t in self._successors(q):
+                if t not in seen and (within is None or t in within):
+                    seen.add(t)
+                    queue.append(t)
+        return set(queue)
+
+    def _backward(self, roots, seen: set, within: set|None=None) -> set:
+        # as _forward, against the edges
+        queue = [q for q in set(roots) if q not in seen and (within is None or q in within)]
+        seen.update(queue)
+        for t in queue:
+            for q, _ in self.preds.get(t, ()):
+                if q not in seen and (within is None or q in within):
+                    seen.add(q)
+                    queue.append(q)
+        return set(queue)
+
+    def _reaches_final(self, q) -> bool:
+        # depth first, stopping at the first final state
+        F = self.M.F
+        seen, stack = {q}, [q]
+        while stack:
+            p = stack.pop()
+            if p in F: return True
+            for t in self._successors(p):
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+        return False
+
+    # classes
+
+    def _sig_of(self, q) -> tuple:
+        # the signature, and the finality of each live successor (None for the others), which the classes fix
+        delta, live, cls, F = self.M.delta, self.live, self.cls, self.M.F
+        succ = [delta.get((q, a)) for a in self.symbols]
+        succ = [t if t is not None and t in live else None for t in succ]
+        return (q in F, tuple(None if t is None else cls[t] for t in succ), tuple(None if t is None else t in F for t in succ))
+
+    @staticmethod
+    def _shape(s: tuple) -> tuple:
+        # what equivalent classes always share: their finality and that of their successors
+        return s[0], s[2]
+
+    def _new_class(self, states=()) -> int:
+        c = self.next_id
+        self.next_id += 1
+        self.members[c] = set(states)
+        for q in states: self.cls[q] = c
+        return c
+
+    def _set_sig(self, c: int, s: tuple|None):
+        old = self.sig.pop(c, None)
+        if old is not None: self.shapes[self._shape(old)].discard(c)
+        if s is None: return
+        self.sig[c] = s
+        self.shapes.setdefault(self._shape(s), set()).add(c)
+
+    def _move(self, q, c):
+        # q changes class (c None: leaves the partition); the live states pointing at q are checked again
+        old = self.cls.pop(q, None)
+        if old is not None:
+            self.members[old].discard(q)
+            if not self.members[old]:
+                del self.members[old]
+                self._set_sig(old, None)
+                if old == self.dead: self.dead = None
+        if c is not None:
+            self.cls[q] = c
+            self.members[c].add(q)
+        self.queue.update(p for p, _ in self.preds.get(q, ()) if p in self.live and p in self.cls)
+
+    def _to_dead(self, q):
+        if self.dead is None: self.dead = self._new_class()
+        self._move(q, self.dead)
+
+    # edits, reported by the dfa before it makes them
+
+    def _check(self):
+        if self.M.version != self.version or tuple(self.M.A) != self.symbols: self.stale = True
+
+    def edge(self, q, a, old, new):
+        """the successor of q on a goes from old to new (either may be None)"""
+        self._check()
+        if old == new: return
+        if old is not None:
+            self.preds[old].discard((q, a))
+            self.cut.add((q, old))
+        if new is not None: self.preds.setdefault(new, set()).add((q, a))
+        self.dirty.add(q)
+
+    def remove(self, qs: set):
+        """the states qs go, with all their edges"""
+        self._check()
+        for q in qs:
+            for p, a in list(self.preds.get(q, ())):
+                if p not in qs: self.edge(p, a, q, None)
+            for a in self.symbols:
+                t = self.M.delta.get((q, a))
+                if t is not None and t not in qs:
+                    self.preds[t].discard((q, a))
+                    self.cut.add((q, t))
+        for q in qs:
+            self.preds.pop(q, None)
+            self.dirty.discard(q)
+            self.reach.discard(q)
+            self.live.discard(q)
+            if q in self.cls: self._move(q, None)
+
+    def vertex(self, q, final: bool):
+        """q is added, without edges"""
+        self._check()
+        if q in self.M.Q: self.stale = True
+        elif final: self.live.add(q)
+
+    def synced(self):
+        """the reported edit is made"""
+        if not self.stale: self.version = self.M.version
+
+    # settling the edits
+
+    def update(self):
+        """bring reachability and the classes up to date with the edits so far"""
+        if self.stale or self.M.version != self.version or self.M.Q_0 != self.start: return self.rebuild()
+        if not self.dirty and not self.cut: return self
+        M = self.M
+        dirty, cut = self.dirty, self.cut
+        self.dirty, self.cut = set(), set()
+        # reach: what hung below a cut edge stays reachable only from outside of it; past the edited states, whatever
+        # was not reachable before is new
+        below = self._forward([t for _, t in cut], set(), self.reach)
+        self.reach -= below
+        roots = [t for t in below if t == M.Q_0 or any(p in self.reach for p, _ in self.preds.get(t, ()))]
+        roots += [t for q in dirty if q in self.reach for t in self._successors(q)]
+        fresh = self._forward(roots, self.reach)
+        gone, fresh = below - fresh, fresh - below
+        # live, the other way round: what could reach F through a cut edge stays live only if it has another way,
+        # and states with a new edge into a live state are live, with everything behind them. A cut whose source
+        # still reaches F changes nothing, which a search forward from it usually shows soonest.
+        above = self._backward([p for p, _ in cut if p in self.live and not self._reaches_final(p)], set(), self.live)
+        self.live -= above
+        roots = [q for q in above if q in M.F or any(t in self.live for t in self._successors(q))]
+        roots += [q for q in dirty if q not in self.live and any(t in self.live for t in self._successors(q))]
+        revived = self._backward(roots, self.live)
+        died, revived = above - revived, revived - above
+        if len(fresh) + len(gone) + len(died) + len(revived) > self.rebuild_share * len(self.reach): return self.rebuild()
+        # the partition: states leave it or die, and new ones come in to a class of their own for now; the states
+        # next to every change are queued for checking
+        self.queue = set(q for q in dirty if q in self.cls and q in self.live)
+        for q in gone:
+            if q in self.cls: self._move(q, None)
+        for q in died:
+            if q in self.cls: self._to_dead(q)
+        for q in fresh | revived:
+            if q not in self.reach: continue
+            if q in self.live:
+                self._move(q, self._new_class())
+                self.queue.add(q)
+            elif q not in self.cls: self._to_dead(q)
+        pending = self._settle()
+        if pending is None: return self.rebuild()
+        # merges of classes whose languages became equal
+        while pending:
+            x = pending.pop()
+            if x not in self.sig: continue
+            for c in list(self.shapes[self._shape(self.sig[x])]):
+                if c == x: continue
+                parent = self._bisimilar(x, c)
+                if parent is None: continue
+                merged = self._merge(parent)
+                more = self._settle()
+                if more is None: return self.rebuild()
+                pending = (pending | more | merged) & self.sig.keys()
+                break
+        return self
+
+    def _settle(self) -> set|None:
+        # check the queued states until every member of every class has its signature; returns the classes whose
+        # signature changed or that are new, or None after checking more states than a rebuild would
+        changed = set()
+        checked, budget = 0, self.rebuild_share * len(self.reach)
+        while self.queue:
+            batch, self.queue = self.queue, set()
+            checked += len(batch)
+            if checked > budget: return None
+            by_class = {}
+            for q in batch:
+                if q in self.cls and q in self.live: by_class.setdefault(self.cls[q], []).append(q)
+            for c, qs in by_class.items():
+                groups = {}
+                for q in qs:
+                    groups.setdefault(self._sig_of(q), []).append(q)
+                if len(qs) < len(self.members[c]):
+                    # the unchecked members keep the class and its signature
+                    groups.pop(self.sig[c], None)
+                else:
+                    # all of them checked: the largest group keeps the class, and gives it its signature
+                    s = max(groups, key=lambda s: len(groups[s]))
+                    del groups[s]
+                    if s != self.sig.get(c):
+                        self._set_sig(c, s)
+                        changed.add(c)
+                for s, moving in groups.items():
+                    target = self._new_class()
+                    self._set_sig(target, s)
+                    changed.add(target)
+                    for q in moving: self._move(q, target)
+        return changed & self.sig.keys()
+
+    @staticmethod
+    def _find(parent: dict, x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def _bisimilar(self, x: int, y: int) -> dict|None:
+        # Hopcroft-Karp: union-find over the classes assumed equal, starting from x = y; None at the first
+        # contradiction, else the union-find of a bisimulation
+        parent = {x: x, y: x}
+        stack = [(x, y)]
+        while stack:
+            u, v = stack.pop()
+            su, sv = self.sig[u], self.sig[v]
+            if su[0] != sv[0]: return None
+            for e1, e2 in zip(su[1], sv[1]):
+                if e1 is None or e2 is None:
+                    if e1 != e2: return None
+                    continue
+                r1, r2 = self._find(parent, parent.setdefault(e1, e1)), self._find(parent, parent.setdefault(e2, e2))
+                if r1 != r2:
+                    parent[r2] = r1
+                    stack.append((e1, e2))
+        return parent
+
+    def _merge(self, parent: dict) -> set:
+        # the classes of each group of the bisimulation go into the largest of them. The signatures of the groups
+        # agree once each class is read as the one its group went into, so that is the signature of the merged
+        # class; the states pointing into merged classes are checked again by _move.
+        into = {}
+        for group in self._groups(parent):
+            keep = max(group, key=lambda y: len(self.members[y]))
+            for y in group: into[y] = keep
+        for y, keep in into.items():
+            if y == keep: continue
+            self._set_sig(y, None)
+            for q in list(self.members[y]): self._move(q, keep)
+        for keep in set(into.values()):
+            f, succ, finals = self.sig[keep]
+            self._set_sig(keep, (f, tuple(into.get(e, e) for e in succ), finals))
+        return set(into.values())
+
+    def _groups(self, parent: dict) -> list:
+        groups = {}
+        for y in parent: groups.setdefault(self._find(parent, y), []).append(y)
+        return list(groups.values())
+
+    # queries
+
+    def classes(self) -> list:
+        """the classes of equivalent reachable states, the dead ones (if any) last"""
+        self.update()
+        dead = [list(self.members[self.dead])] if self.dead is not None else []
+        return [list(S) for c, S in self.members.items() if c != self.dead] + dead
+
+    def view(self):
+        """the minimal dfa, as a new dfa over one state per class (Q_0 for its own)"""
+        from dfa import dfa
+        self.update()
+        M = self.M
+        rep = {c: (M.Q_0 if M.Q_0 in S else next(iter(S))) for c, S in self.members.items()}
+        D = dfa(set(rep.values()), set(M.A), M.Q_0, set(q for q in rep.values() if q in M.F), name=M.name + '.minimized')
+        for q in rep.values():
+            for a in self.symbols:
+                t = M.delta.get((q, a))
+                if t is not None: D.delta[(q, a)] = rep[self.cls[t]]
+        return D
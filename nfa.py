@@ -1,10 +1,143 @@
 # Om Sri Sai Ram
 
-import graphviz as gv
-from automaton import automaton
+from automaton import automaton, StateBudgetExceeded, iter_bits, bits_to_int, dfa_delta, nfa_delta, profiler, timed, verdict
 import dfa
+from compiled import compiled_nfa
+import parallel
+import render
+from collections import OrderedDict, deque
+
+class subset_delta(dfa_delta):
+    """transition table of an on-demand subset construction: the entry for (X, a) is computed on its
+    first lookup, added to the DFA (together with any new subset-state) and cached. Reading the table as a whole
+    (edges, items, len, and the dfa methods that call expand) first computes every transition that is left."""
+    __slots__ = ('M', 'D', 'max_states', 'expanded')
+
+    def __init__(self, M: 'nfa', D: 'dfa.dfa', max_states: int|None=None) -> None:
+        super().__init__(D.states, D.symbols)
+        self.M = M
+        self.D = D
+        self.max_states = max_states
+        # version at which every transition was last known to be computed
+        self.expanded = -1
+
+    def expand(self):
+        # the rest of the subset construction, from every subset-state reached so far
+        if self.expanded == self.version: return self
+        queue = list(self.D.Q)
+        seen = set(queue)
+        for X in queue:
+            for a in self.M.A:
+                Y = self[(X, a)]
+                if Y not in seen:
+                    seen.add(Y)
+                    queue.append(Y)
+        self.expanded = self.version
+        return self
+
+    def edges(self):
+        self.expand()
+        return super().edges()
+
+    def __len__(self):
+        self.expand()
+        return super().__len__()
+
+    def __getitem__(self, key):
+        try:
+            return super().__getitem__(key)
+        except KeyError:
+            pass
+        X, a = key
+        if X not in self.D.Q or a not in self.M.A: raise KeyError(key)
+        p = profiler.active
+        if p is not None: p.count('to_dfa.transitions')
+        Y = frozenset(self.M.step(X, a))
+        if Y not in self.D.Q:
+            if self.max_states is not None and len(self.D.Q) >= self.max_states:
+                raise StateBudgetExceeded(f'{self.D.name}: more than {self.max_states} subset-states')
+            self.D.add_vertex(Y, final=bool(Y & self.M.F))
+            if p is not None:
+                p.count('to_dfa.subset_states')
+                p.tick('to_dfa', len(self.D.Q))
+        self[key] = Y
+        return Y
+
+    def walk(self, s: int, word) -> int:
+        # through the labels, so that missing transitions get computed
+        q = self.states.items[s]
+        for a in word:
+            if (q, a) not in self: return -1
+            q = self[(q, a)]
+        return self.states.ids[q]
+
+    def __contains__(self, key):
+        if super().__contains__(key): return True
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+def _plain(M) -> 'nfa':
+    # nfa without eps-edges for the language of the dfa, nfa or eps_nfa M
+    if isinstance(M, dfa.dfa) or isinstance(M, eps_nfa): return M.to_nfa()
+    return M
+
+def _word(parent: dict, node) -> str:
+    word = []
+    while parent[node] is not None:
+        node, a = parent[node]
+        word.append(a)
+    return ''.join(reversed(word))
+
+def _antichain_witness(M: 'nfa', N: 'nfa|None', symbols: list):
+    # shortest word accepted by N (any word, if N is None) and rejected by M, or None. Breadth-first search over
+    # the pairs (p, S) of a state id p of N and the set S of state ids M can be in after the same word, without
+    # determinizing M: since a word rejected from S is rejected from every subset of S, a pair is dropped when some
+    # pair (p, S') with S' a subset of S was reached before (no later in BFS order), and only the antichains of
+    # the subset-minimal S per p are kept. (De Wulf, Doyen, Henzinger, Raskin, CAV'06.)
+    rows_M = [M.delta.row(a) for a in symbols]
+    final_M = frozenset(M.states.ids[q] for q in M.F)
+    if N is None:
+        starts, rows_N, final_N = [0], None, set([0])
+    else:
+        starts = [N.states.ids[q] for q in N.Q_0]
+        rows_N = [N.delta.row(a) for a in symbols]
+        final_N = set(N.states.ids[q] for q in N.F)
+    antichains: dict = {}
+    parent = {}
+    queue = deque()
+    def insert(node, prev):
+        p, S = node
+        chain = antichains.setdefault(p, [])
+        if any(T <= S for T in chain): return
+        chain[:] = [T for T in chain if not S <= T]
+        chain.append(S)
+        parent[node] = prev
+        queue.append(node)
+    S_0 = frozenset(M.states.ids[q] for q in M.Q_0)
+    for p in starts:
+        insert((p, S_0), None)
+    p = profiler.active
+    while queue:
+        node = queue.popleft()
+        q, S = node
+        if p is not None: p.count('antichain.pairs')
+        if q in final_N and not S & final_M: return _word(parent, node)
+        for i, a in enumerate(symbols):
+            T = set()
+            for s in S:
+                ts = rows_M[i].get(s)
+                if ts is not None: T.update(ts)
+            T = frozenset(T)
+            for q2 in ((0,) if rows_N is None else rows_N[i].get(q, ())):
+                insert((q2, T), (node, a))
+    return None
 
 class nfa(automaton):
+    delta_type = nfa_delta
+
     def __init__(self, Q: set|list|int, A: set|list|int, Q_0: set|list|str, F: set|list|str, name:str|None=None) -> None:
         super().__init__(Q, A, F, name)
         self.Q_0 = self._format(Q_0)
@@ -19,50 +152,25 @@ class nfa(automaton):
         assert q1 in self.Q, f'q1 = {q1} not in Q = {self.Q}'
         assert q2 in self.Q, f'q2 = {q2} not in Q = {self.Q}'
         assert a in self.A, f'a = {a} not in A = {self.A}'
-        if (q1, a) not in self.delta:
-            self.delta[(q1, a)] = set([q2])
-        else:
-            self.delta[(q1, a)].add(q2)
+        self.delta.add(q1, a, q2)
     
     def remove_edge(self, q1, q2, a):
         assert q1 in self.Q, f'q1 = {q1} not in Q = {self.Q}'
         assert q2 in self.Q, f'q2 = {q2} not in Q = {self.Q}'
         assert a in self.A, f'a = {a} not in A = {self.A}'
-        if (q1, a) not in self.delta: return
-        it: set = self.delta[(q1, a)]
-        if q2 in it:
-            it.remove(q2)
-            if len(it) == 0:
-                self.delta.pop((q1, a))
+        self.delta.discard(q1, a, q2)
     
     def draw_format(self, q):
         return q
     
-    def draw(self, savefig=False, directory=None, filename=None):
-        fig = gv.Digraph(self.name, format='png')
-        status = {q: False for q in self.Q}
-        for q in self.Q_0:
-            fig.node(str(q), shape='circle', color='red')
-            status[q] = True
-        for q in self.F:
-            if status[q]:
-                fig.node(str(q), shape='doublecircle', color='red')
-            else:
-                fig.node(str(q), shape='doublecircle')
-            status[q] = True
-        for q in self.Q:
-            if status[q]: continue
-            fig.node(str(q), shape='circle')
-        for (q1, a), q2s in self.delta.items():
-            for q2 in q2s:
-                fig.edge(str(q1), str(q2), label=a)
-        # want the graph to be more left to right than top to bottom
-        fig.graph_attr['rankdir'] = 'LR'
-        # and fairly large
-        fig.graph_attr['size'] = '10'
-        if savefig:
-            fig.render(filename if filename else self.name, directory=directory, view=False)
-        return fig
+    def draw(self, savefig=False, directory=None, filename=None, compact: bool|None=None, around=None, hops: int=2,
+             engine: str|None=None):
+        """Graphviz drawing of the nfa; compact, around and hops give smaller drawings of large ones (see render.py)"""
+        delta, symbols = self.delta, sorted(self.A, key=str)
+        def successors(q):
+            for a in symbols:
+                for t in delta.get((q, a), ()): yield a, t
+        return render.draw(self, set(self.Q_0), successors, savefig, directory, filename, compact, around, hops, engine)
     
     def extended_delta(self, X: set, word: str):
         if len(X) == 0: return X
@@ -72,39 +180,142 @@ class nfa(automaton):
         # D(X, epsilon) = X
         # D(X, a) = union_{q' E X} d(q', a)
         # D(X, aw) = D(D(X, a),w)
+        # unrolled into a loop over the word, so there is no recursion and no slicing of the word.
+        for a in word:
+            X = self.step(X, a)
+            if len(X) == 0: break
+        return X
 
-        if len(word) == 0:
-            return X
-        # recurse. We recurse on single head and tail (this seems to be faster in Python than on l[:-1] and l[-1])
-        head = word[0]
-        tail = word[1:]
-        # print("yee", head, tail)
-        one_step_lst = [self.delta[(q, head)] for q in X if (q, head) in self.delta]
-        one_step = set.union(*one_step_lst) if len(one_step_lst) > 0 else set()
-        return self.extended_delta(one_step, tail)
-
-    def clear_edges(self):
-        self.delta = {}
-        return self
-    
-    def to_dfa(self):
-        # we will use the powerset construction
-        def powerset(s):
-            # https://stackoverflow.com/questions/1482308/how-to-get-all-subsets-of-a-set-powerset
-            masks = [1 << i for i in range(len(s))]
-            for i in range(1 << len(s)):
-                yield frozenset(elem for mask, elem in zip(masks, s) if i & mask)
-        Q = set(powerset(self.Q))
+    def step(self, X: set, a):
+        # one-symbol delta on a set of states: union_{q E X} d(q, a), taken over the interned ids
+        return self.delta.image(X, a)
+
+    def to_dfa(self, max_states: int|None=None, lazy: bool=False, minimize_every: int|None=None):
+        # subset construction, restricted to the subsets reachable from Q_0. With lazy=True the
+        # transitions are only computed (and cached) the first time a run looks them up.
+        # max_states bounds the number of subset-states built; StateBudgetExceeded is raised past it.
+        # With minimize_every=k the dfa built so far is minimized in place, the states not expanded yet each kept
+        # apart from all others, whenever at least k new subset-states were added and the dfa doubled in size since
+        # the last time (so the minimizations cost O(log) full passes), and once more at the end: the result is the
+        # minimal dfa, and max_states bounds the minimized dfa rather than every subset ever reached.
         Q_0 = frozenset(self.Q_0)
-        # print(Q)
-        F = set(q for q in Q if q.intersection(self.F))
-        dfa2 = dfa.dfa(Q, self.A, Q_0, F, name=self.name + ".to_dfa")
-        for q in Q:
-            for a in self.A:
-                dfa2.delta[(q, a)] = frozenset(self.extended_delta(q, a))
-                assert dfa2.delta[(q, a)] in Q, f'dfa2.delta[{q}, {a}] = {dfa2.delta[(q, a)]} not in Q = {Q}'
+        F = set([Q_0]) if Q_0 & self.F else set()
+        dfa2 = dfa.dfa(set([Q_0]), set(self.A), Q_0, F, name=self.name + ".to_dfa")
+        if lazy:
+            assert minimize_every is None, 'a lazy dfa cannot be minimized while it is built'
+            dfa2.delta = subset_delta(self, dfa2, max_states)
+            return dfa2
+        # the subsets are built as frozensets of state ids and turned into frozensets of labels once each; seen maps
+        # them to the ids of their dfa states, and merged the ids of states merged away to what they were merged into
+        p = profiler.active
+        items = self.states.items
+        table = dfa2.states
+        rows = [(a, self.delta.row(a)) for a in self.A]
+        start = frozenset(self.states.ids[q] for q in Q_0)
+        seen = {start: table.ids[Q_0]}
+        merged = {}
+        worklist = [start]
+        grown = 0
+        with timed('nfa.to_dfa'):
+            while worklist:
+                S = worklist.pop()
+                X = table.items[seen[S]]
+                if p is not None: p.count('to_dfa.transitions', len(rows))
+                for a, row in rows:
+                    T = set()
+                    for s in S:
+                        ts = row.get(s)
+                        if ts is not None: T.update(ts)
+                    T = frozenset(T)
+                    j = seen.get(T)
+                    if j is None:
+                        if max_states is not None and len(dfa2.Q) >= max_states:
+                            raise StateBudgetExceeded(f'{self.name}.to_dfa: more than {max_states} subset-states')
+                        Y = frozenset(items[t] for t in T)
+                        dfa2.add_vertex(Y, final=any(items[t] in self.F for t in T))
+                        seen[T] = table.ids[Y]
+                        worklist.append(T)
+                        grown += 1
+                        if p is not None:
+                            p.count('to_dfa.subset_states')
+                            p.tick('to_dfa', len(seen))
+                    else:
+                        while j in merged: j = merged[j]
+                        Y = table.items[j]
+                    dfa2.delta[(X, a)] = Y
+                if minimize_every is not None and grown >= max(minimize_every, len(dfa2.Q) - grown):
+                    merged.update(dfa2._merge_equivalent(set(table.items[seen[S]] for S in worklist)))
+                    grown = 0
+            if minimize_every is not None:
+                dfa2._merge_equivalent(set())
         return dfa2
 
+    def _subset_growth(self, budget: int) -> tuple:
+        # probe of the subset construction, breadth-first and stopped at budget subset-states:
+        # (whether it completed, number of layers it got through)
+        rows = [self.delta.row(a) for a in self.A]
+        start = frozenset(self.states.ids[q] for q in self.Q_0)
+        seen = set([start])
+        layer = [start]
+        depth = 0
+        while layer:
+            next_layer = []
+            for S in layer:
+                for row in rows:
+                    T = set()
+                    for s in S:
+                        ts = row.get(s)
+                        if ts is not None: T.update(ts)
+                    T = frozenset(T)
+                    if T in seen: continue
+                    if len(seen) >= budget: return False, depth
+                    seen.add(T)
+                    next_layer.append(T)
+            layer = next_layer
+            depth += 1
+        return True, depth
+
+    def choose_strategy(self, budget: int|None=None) -> str:
+        """'subset+hopcroft' or 'brzozowski', whichever probes of the subset construction (of at most budget
+        subset-states, by default 8 per state and at least 256) suggest is cheaper for this nfa"""
+        budget = budget if budget else max(256, 8 * len(self.Q))
+        # a forward construction that stays within the budget is small, and minimizing it is cheap
+        done, depth = self._subset_growth(budget)
+        if done: return 'subset+hopcroft'
+        # otherwise the reversed construction is the first (and largest unminimized) dfa of brzozowski's; take it
+        # if it stays within the budget or grows slower, i.e. gets through more layers on the same budget
+        done_reverse, depth_reverse = self.reverse()._subset_growth(budget)
+        return 'brzozowski' if done_reverse or depth_reverse > depth else 'subset+hopcroft'
+
+    def minimal_dfa(self, strategy: str='auto', max_states: int|None=None, minimize_every: int|None=None):
+        """minimal dfa for the language of this nfa, relabelled with start state 0. strategy is 'subset+hopcroft'
+        (to_dfa, then minimize; minimize_every is passed on to to_dfa), 'brzozowski' (determinize the reverse of the
+        determinized reverse, which is minimal as built) or 'auto' (see choose_strategy). max_states bounds every
+        determinization."""
+        if strategy == 'auto': strategy = self.choose_strategy()
+        assert strategy in ('subset+hopcroft', 'brzozowski'), f'unknown strategy {strategy}'
+        with timed('nfa.minimal_dfa.' + strategy):
+            if strategy == 'brzozowski':
+                D = self.reverse().to_dfa(max_states).reverse().to_dfa(max_states)
+            else:
+                D = self.to_dfa(max_states, minimize_every=minimize_every)
+                if minimize_every is None: D.minimize()
+        D.name = self.name + '.minimal_dfa'
+        return D.relabel()
+
+    def compile(self, method: str='auto'):
+        """frozen bitset simulator for this nfa (see compiled.compiled_nfa); recompile after editing"""
+        with timed('nfa.compile'):
+            return compiled_nfa(self.Q, self.A, self.Q_0, self.F, self.delta, method)
+
+    def accepts_parallel(self, words, workers: int|None=None, chunksize: int=4096, ordered: bool=True):
+        """accepts over many words on a process pool sharing one compiled table (see parallel.accepts_parallel)"""
+        return parallel.accepts_parallel(self.compile(), words, workers, chunksize, ordered)
+
+    def matcher(self):
+        """streaming matcher over chunked input (see compiled.nfa_matcher), on a compiled copy of this nfa"""
+        return self.compile().matcher()
+
     def load_from_dfa(self, M: dfa.dfa):
         super().__init__(M.Q, M.A, M.F, name=M.name + '.nfa')
         self.Q_0 = self._format(set([M.Q_0]))
@@ -112,9 +323,75 @@ class nfa(automaton):
             self.delta[(q, a)] = set([q2])
 
     def accepts(self, word: str):
+        p = profiler.active
+        if p is not None:
+            p.count('accepts.calls')
+            p.count('accepts.symbols', len(word))
+        classes = self.symbol_classes()
+        if classes is not None: word = classes.classify(word)
         return self.extended_delta(self.Q_0, word) & self.F != set()
+
+    def reverse(self):
+        """automaton of the same kind for the reversed language: every edge flipped, Q_0 and F swapped"""
+        M = type(self)(set(self.Q), set(self.A), set(self.F), set(self.Q_0), name=self.name + '.reverse')
+        for (q, a), q2s in self.delta.items():
+            for q2 in q2s:
+                M.add_edge(q2, q, a)
+        return M
+
+    # Decision procedures, on the eps-free nfa of the language (see _plain) and without determinizing: emptiness
+    # by a breadth-first search over the states, the others by the antichain search of _antichain_witness. The
+    # counterexamples are shortest words.
+
+    def is_empty(self) -> verdict:
+        M = _plain(self)
+        parent = dict.fromkeys(M.Q_0)
+        queue = deque(M.Q_0)
+        while queue:
+            q = queue.popleft()
+            if q in M.F: return verdict(False, _word(parent, q))
+            for a in M.A:
+                for q2 in M.delta.get((q, a), ()):
+                    if q2 not in parent:
+                        parent[q2] = (q, a)
+                        queue.append(q2)
+        return verdict(True)
+
+    def is_universal(self) -> verdict:
+        """whether every word over A (eps aside) is accepted"""
+        M = _plain(self)
+        w = _antichain_witness(M, None, list(M.A))
+        return verdict(w is None, w)
+
+    def includes(self, other) -> verdict:
+        """whether L(other) is a subset of L(self); other is a dfa, nfa or eps_nfa. If not, the counterexample is in
+        L(other) but not in L(self)."""
+        M, N = _plain(self), _plain(other)
+        w = _antichain_witness(M, N, list(M.A | N.A))
+        return verdict(w is None, w)
+
+    def equivalent(self, other) -> verdict:
+        """whether L(self) = L(other), by inclusion both ways; if not, the counterexample is a shortest word in
+        exactly one of them"""
+        M, N = _plain(self), _plain(other)
+        words = [w for w in (_antichain_witness(M, N, list(M.A | N.A)), _antichain_witness(N, M, list(M.A | N.A))) if w is not None]
+        return verdict(False, min(words, key=len)) if words else verdict(True)
     
 if __name__ == '__main__':
+    # a lazy dfa read as a whole (compiled, counted, minimized) is completed first, and agrees with the eager one
+    from itertools import product
+    N = nfa(3, ['a', 'b'], [0], [2], name='ends_with_ab')
+    N.add_edge(0, 0, 'a')
+    N.add_edge(0, 0, 'b')
+    N.add_edge(0, 1, 'a')
+    N.add_edge(1, 2, 'b')
+    words = [''.join(w) for n in range(6) for w in product('ab', repeat=n)]
+    E = N.to_dfa()
+    assert all(N.to_dfa(lazy=True).compile().accepts(w) == E.accepts(w) for w in words)
+    assert all(N.to_dfa(lazy=True).count_words(n) == E.count_words(n) for n in range(6))
+    L = N.to_dfa(lazy=True).minimize()
+    assert len(L.Q) == len(E.minimized_view().Q) and all(L.accepts(w) == E.accepts(w) for w in words)
+
     Q = ['q0', 'q1', 'q2']
     A = ['0', '1']
     Q_0 = ['q0']
@@ -141,57 +418,146 @@ if __name__ == '__main__':
 
 class eps_nfa(nfa):
     eps = 'ϵ'
+    closure_cache_size = 4096
     def __init__(self, Q: set | list | int, A: set | list | int, Q_0: set | list | str, F: set | list | str, name: str | None = None) -> None:
         super().__init__(Q, A, Q_0, F, name)
         self.A.add(self.eps)
+        self.invalidate_closure()
+
+    # the closures are computed for one version of the automaton (see automaton.version), so any edit, through the
+    # methods or directly on Q, F and delta, drops them on the next lookup
+    def invalidate_closure(self):
+        self.closure = None
+        self.closure_version = None
+        self.closure_cache = OrderedDict()
 
     def eps_closure(self, X: set):
-        if not hasattr(self, 'closure'): 
-            self.set_eps_closure()
-        if isinstance(X, set):
-            return set.union(*[self.closure[q] for q in X])
-        assert X in self.Q, f'X = {X} not in Q = {self.Q}'
-        return self.closure[X]
+        self.set_eps_closure()
+        index, states, masks = self.closure
+        if not isinstance(X, (set, frozenset)):
+            assert X in self.Q, f'X = {X} not in Q = {self.Q}'
+            X = frozenset([X])
+        # closures of sets that come up again are served from a small LRU cache
+        key = frozenset(X)
+        cache = self.closure_cache
+        p = profiler.active
+        if key in cache:
+            if p is not None: p.count('eps_closure.cache.hits')
+            cache.move_to_end(key)
+            return set(cache[key])
+        if p is not None: p.count('eps_closure.cache.misses')
+        m = 0
+        for q in X:
+            m |= masks[index[q]]
+        closure = set(states[i] for i in iter_bits(m))
+        cache[key] = frozenset(closure)
+        if len(cache) > self.closure_cache_size:
+            cache.popitem(last=False)
+        return closure
     
     def set_eps_closure(self):
-        if hasattr(self, 'closure'): return
-        closures = {}
-        def recurse(q):
-            if q in closures: return closures[q]
-            closure = set([q])
-            if (q, self.eps) in self.delta:
-                for q_ in self.delta[(q, self.eps)]:
-                    closure = closure.union(recurse(q_))
-            closures[q] = closure
-            return closure
-        for q in self.Q:
-            recurse(q)
-        self.closure = closures
+        # Tarjan's SCC algorithm, iteratively, on the eps-edges. Components come out in reverse topological order,
+        # so when a component is popped the closures of all components it has eps-edges into are known: its closure
+        # (as a bitmask over the states) is its own states OR'd with those. States of one component share a closure.
+        if self.closure is not None and self.closure_version == self.version: return self
+        self.invalidate_closure()
+        with timed('eps_nfa.set_eps_closure'):
+            self._tarjan()
+        self.closure_version = self.version
         return self
+
+    def _tarjan(self):
+        states = list(self.Q)
+        index = {q: i for i, q in enumerate(states)}
+        n = len(states)
+        succ = [[index[q2] for q2 in self.delta.get((q, self.eps), ())] for q in states]
+        order = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        comp = [-1] * n
+        comp_masks = []
+        stack = []
+        counter = 0
+        for root in range(n):
+            if order[root] != -1: continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            calls = [(root, iter(succ[root]))]
+            while calls:
+                v, it = calls[-1]
+                for w in it:
+                    if order[w] == -1:
+                        order[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        calls.append((w, iter(succ[w])))
+                        break
+                    if on_stack[w]:
+                        low[v] = min(low[v], order[w])
+                else:
+                    calls.pop()
+                    if calls:
+                        u = calls[-1][0]
+                        low[u] = min(low[u], low[v])
+                    if low[v] != order[v]: continue
+                    c = len(comp_masks)
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = c
+                        members.append(w)
+                        if w == v: break
+                    m = bits_to_int(members, n)
+                    for w in members:
+                        for x in succ[w]:
+                            if comp[x] != c: m |= comp_masks[comp[x]]
+                    comp_masks.append(m)
+        self.closure = (index, states, [comp_masks[comp[i]] for i in range(n)])
+        p = profiler.active
+        if p is not None: p.count('eps_closure.components', len(comp_masks))
     
     def extended_delta(self, X: set, word: str):
         if len(X) == 0: return X
         assert X.issubset(self.Q), f'X = {X} not a subset of Q = {self.Q}'
         self.set_eps_closure()
         X = self.eps_closure(X)
+        for a in word:
+            X = self.eps_closure(self.step(X, a))
+            if len(X) == 0: break
+        return X
 
-        if len(word) == 0:
-            return X
-        head = word[0]; tail = word[1:]
-        one_step_lst = [self.eps_closure(self.delta[(q, head)]) for q in X if (q, head) in self.delta]
-        one_step = self.eps_closure(set.union(*one_step_lst)) if len(one_step_lst) > 0 else set()
-        return self.extended_delta(one_step, tail)
+    def compile(self, method: str='auto'):
+        # the closures are folded into the successor sets, so the compiled run never follows an eps-edge
+        self.set_eps_closure()
+        delta = {(q, a): self.eps_closure(q2s) for (q, a), q2s in self.delta.items() if a != self.eps}
+        return compiled_nfa(self.Q, self.A - set([self.eps]), self.eps_closure(self.Q_0), self.F, delta, method)
     
     def to_nfa(self):
         A = self.A - set([self.eps])
         self.set_eps_closure()
         M = nfa(self.Q, A, self.eps_closure(self.Q_0), self.F, name=self.name + '.to_nfa')
         
-        for (q, a) in self.delta:
-            if a == self.eps: continue
-            M.delta[(q, a)] = self.eps_closure(self.extended_delta(set([q]), a))
-            # these are not the only edges that will be added - or are they?
+        with timed('eps_nfa.to_nfa'):
+            for (q, a) in self.delta:
+                if a == self.eps: continue
+                M.delta[(q, a)] = self.eps_closure(self.extended_delta(set([q]), (a,)))
+                # these are not the only edges that will be added - or are they?
         return M
     
-    def to_dfa(self):
-        return self.to_nfa().to_dfa()
+    def to_dfa(self, max_states: int|None=None, lazy: bool=False, minimize_every: int|None=None):
+        return self.to_nfa().to_dfa(max_states, lazy, minimize_every)
+
+    # the eps-edges are eliminated once, up front; the probes and both strategies then run on the eps-free nfa, whose
+    # size already accounts for the eps-density (every eps-closure is folded into the edges)
+
+    def choose_strategy(self, budget: int|None=None) -> str:
+        return self.to_nfa().choose_strategy(budget)
+
+    def minimal_dfa(self, strategy: str='auto', max_states: int|None=None, minimize_every: int|None=None):
+        D = self.to_nfa().minimal_dfa(strategy, max_states, minimize_every)
+        D.name = self.name + '.minimal_dfa'
+        return D
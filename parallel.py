@@ -0,0 +1,77 @@
+import numpy as np
+from itertools import islice
+from multiprocessing import Pool, shared_memory
+from compiled import compiled_dfa, compiled_nfa
+
+# Batch acceptance on a process pool. The compiled transition table is copied once into a shared memory block; the
+# workers attach to it by name and build their matcher over views of it, so no delta dict (or table) is ever
+# pickled. Only the words and the results travel between processes.
+
+def share(arrays: dict):
+    """copy the arrays into one new shared memory block; returns the block and the layout needed to attach to it"""
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        layout[name] = (offset, arr.dtype.str, arr.shape)
+        offset += (arr.nbytes + 63) // 64 * 64
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, arr in arrays.items():
+        off, dtype, shape = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)[...] = arr
+    return shm, layout
+
+def attach(name: str, layout: dict):
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 the attach is registered with the pool's (shared) resource tracker too; the creating
+        # process unlinks the block, which also unregisters it
+        shm = shared_memory.SharedMemory(name=name)
+    arrays = {key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off) for key, (off, dtype, shape) in layout.items()}
+    return shm, arrays
+
+worker: dict = {}
+
+def init_worker(kind: str, name: str, layout: dict, symbols: list, n: int):
+    shm, arrays = attach(name, layout)
+    worker['shm'] = shm
+    if kind == 'dfa':
+        worker['M'] = compiled_dfa.from_tables(symbols, arrays['full'], arrays['final'], rows=False)
+        return
+    worker['M'] = compiled_nfa.from_csr(symbols, n, arrays['indptr'], arrays['indices'], arrays['start'], arrays['final'])
+
+def run_chunk(task):
+    i, words = task
+    M = worker['M']
+    if isinstance(M, compiled_dfa):
+        return i, M.accepts_many(words).tolist()
+    return i, [M.accepts(w) for w in words]
+
+def chunks(words, chunksize: int):
+    it = iter(words)
+    i = 0
+    while True:
+        chunk = list(islice(it, chunksize))
+        if not chunk: return
+        yield i, chunk
+        i += len(chunk)
+
+def accepts_parallel(M: compiled_dfa|compiled_nfa, words, workers: int|None=None, chunksize: int=4096, ordered: bool=True):
+    """acceptance of every word of the iterable words by M, computed on a pool of workers processes. Yields the results
+    in input order, or with ordered=False (index, accepted) pairs as soon as their chunk is done."""
+    if isinstance(M, compiled_dfa):
+        kind, arrays = 'dfa', {'full': M.full, 'final': M.final}
+    else:
+        kind, arrays = 'nfa', M.to_csr()
+    shm, layout = share(arrays)
+    try:
+        with Pool(workers, initializer=init_worker, initargs=(kind, shm.name, layout, list(M.symbols), M.n)) as pool:
+            if ordered:
+                for _, results in pool.imap(run_chunk, chunks(words, chunksize)):
+                    yield from results
+            else:
+                for i, results in pool.imap_unordered(run_chunk, chunks(words, chunksize)):
+                    yield from enumerate(results, i)
+    finally:
+        shm.close()
+        shm.unlink()
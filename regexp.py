@@ -0,0 +1,212 @@
+from functools import lru_cache
+from nfa import eps_nfa
+from symbolic import char_class, everything, partition
+
+# Thompson's construction: a regex is parsed into a small syntax tree, and every node becomes an eps_nfa fragment
+# with one entry and one exit state, glued together with eps-edges.
+#
+# syntax: concatenation, a|b, a*, a+, a?, a{m}, a{m,}, a{m,n}, (grouping), . (any symbol of the alphabet),
+# [abc], [a-z], [^...] character classes, and \ to escape any of the special characters
+#
+# Character classes are kept as char_classes (code point intervals). With symbolic=True the alphabet is not a set of
+# characters but the partition of the pattern's classes into blocks (see symbolic.py): . and [^...] then stand for
+# all of Unicode, and [a-z] is one symbol rather than 26.
+
+special = set('|*+?{}()[].\\')
+
+class regex_parser:
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        self.i = 0
+
+    def error(self, msg: str):
+        return ValueError(f'{msg} at position {self.i} in {self.pattern!r}')
+
+    def peek(self):
+        return self.pattern[self.i] if self.i < len(self.pattern) else None
+
+    def take(self):
+        c = self.peek()
+        if c is None: raise self.error('unexpected end of pattern')
+        self.i += 1
+        return c
+
+    def parse(self):
+        tree = self.alternation()
+        if self.peek() is not None: raise self.error(f'unexpected {self.peek()!r}')
+        return tree
+
+    def alternation(self):
+        branches = [self.concatenation()]
+        while self.peek() == '|':
+            self.take()
+            branches.append(self.concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def concatenation(self):
+        parts = []
+        while self.peek() not in (None, '|', ')'):
+            parts.append(self.repetition())
+        if not parts: return ('eps',)
+        return parts[0] if len(parts) == 1 else ('cat', parts)
+
+    def repetition(self):
+        tree = self.atom()
+        while self.peek() in ('*', '+', '?', '{'):
+            c = self.take()
+            if c == '*': tree = ('rep', tree, 0, None)
+            elif c == '+': tree = ('rep', tree, 1, None)
+            elif c == '?': tree = ('rep', tree, 0, 1)
+            else:
+                lo, hi = self.bounds()
+                tree = ('rep', tree, lo, hi)
+        return tree
+
+    def number(self):
+        start = self.i
+        while self.peek() is not None and self.peek().isdigit():
+            self.i += 1
+        return int(self.pattern[start:self.i]) if self.i > start else None
+
+    def bounds(self):
+        lo = self.number()
+        if lo is None: raise self.error('expected a number in {}')
+        hi = lo
+        if self.peek() == ',':
+            self.take()
+            hi = self.number()
+        if self.take() != '}': raise self.error('expected }')
+        if hi is not None and hi < lo: raise self.error(f'bad repetition {{{lo},{hi}}}')
+        return lo, hi
+
+    def atom(self):
+        c = self.take()
+        if c == '(':
+            tree = self.alternation()
+            if self.peek() != ')': raise self.error('expected )')
+            self.take()
+            return tree
+        if c == '[': return self.char_class()
+        if c == '.': return ('any',)
+        if c == '\\': return ('chars', char_class.of(self.take()), False)
+        if c in special: raise self.error(f'unexpected {c!r}')
+        return ('chars', char_class.of(c), False)
+
+    def char_class(self):
+        negated = self.peek() == '^'
+        if negated: self.take()
+        ranges = []
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            c = self.take()
+            if c == '\\': c = self.take()
+            if self.peek() == '-' and self.pattern[self.i + 1:self.i + 2] not in ('', ']'):
+                self.take()
+                d = self.take()
+                if d == '\\': d = self.take()
+                if ord(d) < ord(c): raise self.error(f'bad range {c}-{d}')
+                ranges.append((ord(c), ord(d)))
+            else:
+                ranges.append((ord(c), ord(c)))
+        self.take()
+        return ('chars', char_class(ranges), negated)
+
+def literals(tree) -> set:
+    # characters mentioned by the pattern, the default alphabet
+    if tree[0] == 'chars': return set(tree[1])
+    if tree[0] in ('alt', 'cat'): return set().union(*[literals(t) for t in tree[1]])
+    if tree[0] == 'rep': return literals(tree[1])
+    return set()
+
+def classes(tree) -> list:
+    # the sets of characters the atoms of the pattern match, whose partition is the symbolic alphabet
+    if tree[0] == 'chars': return [~tree[1] if tree[2] else tree[1]]
+    if tree[0] == 'any': return [everything]
+    if tree[0] in ('alt', 'cat'): return [c for t in tree[1] for c in classes(t)]
+    if tree[0] == 'rep': return classes(tree[1])
+    return []
+
+class thompson:
+    def __init__(self, A: set) -> None:
+        self.A = A
+        self.n = 0
+        self.edges = []
+
+    def state(self):
+        self.n += 1
+        return self.n - 1
+
+    def build(self, tree):
+        # returns the (entry, exit) states of the fragment for tree
+        kind = tree[0]
+        if kind == 'eps':
+            s, e = self.state(), self.state()
+            self.edges.append((s, e, eps_nfa.eps))
+            return s, e
+        if kind in ('chars', 'any'):
+            # a block of a symbolic alphabet lies inside or outside each class of the pattern, like its first character
+            chars = set(self.A) if kind == 'any' else \
+                set(a for a in self.A if ((a.first if isinstance(a, char_class) else a) in tree[1]) != tree[2])
+            s, e = self.state(), self.state()
+            for c in chars:
+                self.edges.append((s, e, c))
+            return s, e
+        if kind == 'cat':
+            s, e = self.build(tree[1][0])
+            for t in tree[1][1:]:
+                s2, e2 = self.build(t)
+                self.edges.append((e, s2, eps_nfa.eps))
+                e = e2
+            return s, e
+        if kind == 'alt':
+            s, e = self.state(), self.state()
+            for t in tree[1]:
+                s2, e2 = self.build(t)
+                self.edges.append((s, s2, eps_nfa.eps))
+                self.edges.append((e2, e, eps_nfa.eps))
+            return s, e
+        assert kind == 'rep', f'unknown regex node {kind}'
+        _, t, lo, hi = tree
+        # t{lo,hi} = t t ... t (lo times) followed by hi - lo optional copies, or by t* when hi is None
+        parts = [t] * lo
+        if hi is None:
+            parts.append(('star', t))
+        else:
+            parts += [('opt', t)] * (hi - lo)
+        s = e = self.state()
+        for part in parts:
+            if part[0] == 'star' or part[0] == 'opt':
+                s2, e2 = self.state(), self.state()
+                s3, e3 = self.build(part[1])
+                self.edges += [(s2, s3, eps_nfa.eps), (e3, e2, eps_nfa.eps), (s2, e2, eps_nfa.eps)]
+                if part[0] == 'star':
+                    self.edges.append((e3, s3, eps_nfa.eps))
+            else:
+                s2, e2 = self.build(part)
+            self.edges.append((e, s2, eps_nfa.eps))
+            e = e2
+        return s, e
+
+@lru_cache(maxsize=4096)
+def _compile_regex(pattern: str, A: frozenset|None, minimize: bool, symbolic: bool):
+    tree = regex_parser(pattern).parse()
+    if symbolic: A = set(partition(classes(tree)))
+    else: A = set(A) if A is not None else literals(tree)
+    builder = thompson(A)
+    start, end = builder.build(tree)
+    M = eps_nfa(builder.n, set(A), [start], [end], name=pattern)
+    for q1, q2, a in builder.edges:
+        M.add_edge(q1, q2, a)
+    if not minimize: return M
+    D = M.to_dfa().minimize().relabel()
+    D.name = pattern
+    return D
+
+def compile_regex(pattern: str, A: set|list|None=None, minimize: bool=False, symbolic: bool=False):
+    """eps_nfa for pattern, by Thompson's construction over the alphabet A (default: the characters the pattern
+    mentions), or with minimize=True the minimal dfa obtained from it through to_nfa, to_dfa and minimize.
+    With symbolic=True the alphabet is the partition of the pattern's character classes over all of Unicode instead
+    (A is ignored). Results are memoized on (pattern, A, minimize, symbolic) in an LRU cache and shared between
+    callers, so treat them as read-only."""
+    return _compile_regex(pattern, frozenset(A) if A is not None else None, minimize, symbolic)
@@ -0,0 +1,118 @@
+import os
+import graphviz as gv
+from graphviz import quoting
+
+# Drawing automata with Graphviz, for dfa.draw and nfa.draw. By default every state is a node named by its label and
+# every transition an edge labelled by its symbol, which is what serialize.load_dot reads back. For larger automata:
+# - compact drawings merge the edges between two states into one, labelled with the class of their symbols (a-d,x),
+#   and name the states with long labels (such as the subsets to_dfa builds) by short ids, listed in a legend node
+#   (in a file next to the DOT file, for streamed drawings);
+# - around and hops limit the drawing to the states within hops transitions of the states around; the states with
+#   transitions leading out of the drawing are dashed;
+# - above stream_above states the drawing is compact and laid out with sfdp instead of dot, and when it goes to a
+#   file (savefig, or a filename or directory given) its DOT source is written there statement by statement instead
+#   of being built as a gv.Digraph in memory.
+
+stream_above = 2000
+# longest state label a compact drawing shows in its node
+label_limit = 12
+
+def state_label(q) -> str:
+    if isinstance(q, frozenset):
+        return str(set(q)) if q else 'ø'
+    return str(q)
+
+def symbol_class(symbols) -> str:
+    """label of an edge for the symbols: sorted, with runs of three or more consecutive characters as ranges"""
+    runs = []
+    for a in sorted(map(str, symbols)):
+        if runs and len(a) == 1 and len(runs[-1][-1]) == 1 and ord(a) == ord(runs[-1][-1]) + 1: runs[-1].append(a)
+        else: runs.append([a])
+    return ','.join(f'{r[0]}-{r[-1]}' if len(r) > 2 else ','.join(r) for r in runs)
+
+def neighborhood(successors, around, hops: int) -> set:
+    """the states within hops transitions of the states around; successors(q) yields the (symbol, state) pairs"""
+    seen = set(around)
+    frontier = list(seen)
+    for _ in range(hops):
+        reached = []
+        for q in frontier:
+            for _, t in successors(q):
+                if t not in seen:
+                    seen.add(t)
+                    reached.append(t)
+        frontier = reached
+    return seen
+
+def _statements(M, starts: set, successors, shown, compact: bool, legend: list):
+    # ('node', name, attributes) and ('edge', name, name, attributes) of the drawing, in the order dot lays them out:
+    # start states, final states, the others, then the edges of each state in turn; the lines of the legend are
+    # added to legend
+    names = {}
+    def name(q) -> str:
+        s = names.get(q)
+        if s is None:
+            s = state_label(q)
+            if compact and len(s) > label_limit:
+                legend.append(f'#{len(legend)} = {s}')
+                s = f'#{len(legend) - 1}'
+            names[q] = s
+        return s
+    order = [q for q in starts if q in shown]
+    order += [q for q in M.F if q in shown and q not in starts]
+    order += [q for q in shown if q not in M.F and q not in starts]
+    for q in order:
+        attrs = {'shape': 'doublecircle' if q in M.F else 'circle'}
+        if q in starts: attrs['color'] = 'red'
+        if shown is not M.Q and any(t not in shown for _, t in successors(q)): attrs['style'] = 'dashed'
+        yield 'node', name(q), attrs
+    for q in order:
+        if not compact:
+            for a, t in successors(q):
+                if t in shown: yield 'edge', name(q), name(t), {'label': str(a)}
+            continue
+        by_target = {}
+        for a, t in successors(q):
+            if t in shown: by_target.setdefault(t, []).append(a)
+        for t, symbols in by_target.items():
+            yield 'edge', name(q), name(t), {'label': symbol_class(symbols)}
+
+def draw(M, starts: set, successors, savefig=False, directory=None, filename=None, compact: bool|None=None,
+         around=None, hops: int=2, engine: str|None=None):
+    """draw M, whose start states are starts and where successors(q) yields the (symbol, state) pairs of the
+    transitions from q. Returns the gv.Digraph (rendered as png if savefig), with one exception: a drawing above
+    stream_above states that goes to a file (savefig, or filename or directory given) is streamed there and not
+    built in memory, and then the path of the DOT file is returned (a str; the legend is in path.legend, and the
+    png next to it if savefig). Nothing is written unless savefig, filename or directory asks for it."""
+    shown = M.Q if around is None else neighborhood(successors, around, hops)
+    large = len(shown) > stream_above
+    stream = large and bool(savefig or filename or directory)
+    if compact is None: compact = large
+    legend = []
+    statements = _statements(M, starts, successors, shown, compact, legend)
+    if not stream:
+        fig = gv.Digraph(M.name, format='png', engine=engine if engine else 'sfdp' if large else 'dot')
+        for s in statements:
+            if s[0] == 'node': fig.node(s[1], **s[2])
+            else: fig.edge(s[1], s[2], **s[3])
+        if legend: fig.node('legend', shape='plaintext', label=''.join(line + '\\l' for line in legend))
+        # want the graph to be more left to right than top to bottom, and fairly large
+        fig.graph_attr['rankdir'] = 'LR'
+        fig.graph_attr['size'] = '10'
+        if large: fig.graph_attr['overlap'] = 'false'
+        if savefig:
+            fig.render(filename if filename else M.name, directory=directory, view=False)
+        return fig
+    path = os.path.join(directory if directory else '', filename if filename else M.name)
+    if directory: os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'digraph {quoting.quote(M.name)} {{\n\tgraph [overlap=false size=10]\n')
+        for s in statements:
+            if s[0] == 'node': f.write(f'\t{quoting.quote(s[1])}{quoting.attr_list(attributes=s[2])}\n')
+            else: f.write(f'\t{quoting.quote(s[1])} -> {quoting.quote(s[2])}{quoting.attr_list(attributes=s[3])}\n')
+        f.write('}\n')
+    if legend:
+        with open(path + '.legend', 'w', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in legend))
+    if savefig: gv.render(engine if engine else 'sfdp', 'png', path)
+    return path
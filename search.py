@@ -0,0 +1,177 @@
+import numpy as np
+from dfa import dfa
+from nfa import nfa, eps_nfa
+
+# Multi-pattern search: report every (pattern id, start, end) with text[start:end] in the language of the pattern.
+# Match ends are found in one left-to-right pass of the product of the prefix-closed automata S*.L_i, whose states
+# are tagged with the ids of the patterns they accept. Starts are found by running the reversed pattern backwards
+# from an end (all-overlapping). For leftmost-longest, one right-to-left pass finds, at every position p, the set of
+# states of the anchored product from which text[p:] still reaches a match (a lazily determinized reverse automaton,
+# see reaching); a match begins at p where the start state is in it, and one forward sweep then runs each chosen match
+# only until its state leaves that set, one symbol past its longest end. Both passes are linear in the text.
+
+def as_nfa(M, A: set) -> nfa:
+    # a fresh nfa over the alphabet A (a superset of M.A) with the language of M
+    if isinstance(M, eps_nfa):
+        M = M.to_nfa()
+    if isinstance(M, dfa):
+        N = nfa(set(M.Q), set(A), set([M.Q_0]), set(M.F), name=M.name)
+        for (q, a), q2 in M.delta.items():
+            if q2 is not None: N.add_edge(q, q2, a)
+        return N
+    N = nfa(set(M.Q), set(A), set(M.Q_0), set(M.F), name=M.name)
+    for (q, a), q2s in M.delta.items():
+        for q2 in q2s:
+            N.add_edge(q, q2, a)
+    return N
+
+def prefix_closed(N: nfa) -> nfa:
+    # S*.L(N): a fresh start state that loops on every symbol and also moves like the start states of N
+    loop = ('S*', N.name)
+    M = as_nfa(N, N.A)
+    M.add_vertex(loop, start=True, final=bool(N.Q_0 & N.F))
+    for a in N.A:
+        M.add_edge(loop, loop, a)
+        for q2 in N.step(N.Q_0, a):
+            M.add_edge(loop, q2, a)
+    M.name = f'S*.{N.name}'
+    return M
+
+def live_states(C) -> 'np.ndarray':
+    # states of a compiled_dfa from which an accepting state is reachable
+    live = C.final.copy()
+    table = C.full[:C.n, :C.k]
+    changed = True
+    while changed:
+        reach = live[:C.n] | live[table].any(axis=1)
+        changed = bool((reach != live[:C.n]).any())
+        live[:C.n] = reach
+    return live
+
+class scanner:
+    """compiled multi-pattern searcher for a list of dfa/nfa/eps_nfa patterns (pattern ids are list positions)"""
+    def __init__(self, automata: list) -> None:
+        if isinstance(automata, (dfa, nfa)): automata = [automata]
+        self.A = set().union(*[set(M.A) - set([eps_nfa.eps]) for M in automata])
+        self.patterns = [as_nfa(M, self.A) for M in automata]
+        self.cache: dict = {}
+
+    def tagged(self, automata: list[dfa]):
+        # compiled product of the automata, with the tuple of accepted pattern ids per product state
+        P = dfa.product(automata, any, name=' x '.join(M.name for M in automata))
+        C = P.compile()
+        tags = [tuple(i for i, (M, q) in enumerate(zip(automata, qs)) if q is not None and q in M.F) for qs in C.states]
+        return C, tags + [()]
+
+    def forward(self):
+        if 'forward' not in self.cache:
+            self.cache['forward'] = self.tagged([prefix_closed(N).to_dfa() for N in self.patterns])
+        return self.cache['forward']
+
+    def anchored(self):
+        if 'anchored' not in self.cache:
+            self.cache['anchored'] = self.tagged([N.to_dfa() for N in self.patterns])
+        return self.cache['anchored']
+
+    def reaching(self):
+        # the reverse automaton of the anchored product C, determinized lazily: a state is the set of states of C from
+        # which some accepting state is reached, interned as an id into sets. step(r, a) is the set before reading a,
+        # namely the accepting states and the predecessors on a of the states in sets[r]
+        if 'reaching' not in self.cache:
+            C, tags = self.anchored()
+            accepting = frozenset(q for q in range(C.n) if tags[q])
+            pred = [{} for _ in range(C.k + 1)]
+            for q in range(C.n):
+                for a, t in enumerate(C.rows[q]):
+                    if t != C.n: pred[a].setdefault(t, []).append(q)
+            sets, index, moves = [accepting], {accepting: 0}, {}
+            def step(r: int, a: int) -> int:
+                key = (r, a)
+                if key not in moves:
+                    R = set(accepting)
+                    for t in sets[r]:
+                        R.update(pred[a].get(t, ()))
+                    R = frozenset(R)
+                    if R not in index:
+                        index[R] = len(sets)
+                        sets.append(R)
+                    moves[key] = index[R]
+                return moves[key]
+            self.cache['reaching'] = sets, step
+        return self.cache['reaching']
+
+    def reverse(self, i: int):
+        if ('reverse', i) not in self.cache:
+            C = self.patterns[i].reverse().to_dfa().compile()
+            self.cache[('reverse', i)] = C, live_states(C)
+        return self.cache[('reverse', i)]
+
+    def symbols(self, C, text: str) -> list:
+        return C._symbols(text)
+
+    def finditer(self, text, overlapping: bool=False):
+        """yield (pattern id, start, end) for the matches in text. With overlapping=True every match of every pattern
+        is reported, ordered by end, pattern id and start. Otherwise matches are leftmost-longest and non-overlapping:
+        the match starting leftmost wins, then the longest one from there, then the smallest pattern id; found in time
+        linear in the text (two passes, each symbol read at most once more past the end of a match)."""
+        if isinstance(text, (bytes, bytearray, memoryview)):
+            text = bytes(text).decode('latin-1')
+        if overlapping:
+            yield from self._all_matches(text)
+        else:
+            yield from self._leftmost_longest(text)
+
+    def _all_matches(self, text):
+        C, tags = self.forward()
+        syms = self.symbols(C, text)
+        # the text as symbol indices of each reversed pattern's table, made on first use
+        rsyms: dict = {}
+        rows, dead, q = C.rows, C.n, 0
+        for end in range(len(syms) + 1):
+            for i in tags[q]:
+                R, live = self.reverse(i)
+                if i not in rsyms: rsyms[i] = self.symbols(R, text)
+                r = 0
+                for start in range(end, -1, -1):
+                    if R.final[r]: yield (i, start, end)
+                    if start == 0: break
+                    r = R.rows[r][rsyms[i][start - 1]]
+                    if not live[r]: break
+            if end == len(syms): break
+            q = rows[q][syms[end]]
+            # a symbol outside the alphabet cannot be part of a match: start over after it
+            if q == dead: q = 0
+
+    def _leftmost_longest(self, text):
+        C, tags = self.anchored()
+        sets, step = self.reaching()
+        n = len(text)
+        syms = self.symbols(C, text)
+        # ahead[p] = the states from which text[p:] reaches a match, right to left
+        ahead = [None] * (n + 1)
+        r = 0
+        ahead[n] = sets[r]
+        for p in range(n - 1, -1, -1):
+            r = step(r, syms[p])
+            ahead[p] = sets[r]
+        pos = 0
+        while pos <= n:
+            if 0 not in ahead[pos]:
+                pos += 1
+                continue
+            best = None
+            q, end = 0, pos
+            while True:
+                if tags[q]: best = (min(tags[q]), end)
+                if end == n: break
+                q = C.rows[q][syms[end]]
+                end += 1
+                # no match ahead: best is the longest one from pos
+                if q not in ahead[end]: break
+            assert best is not None, f'no match starts at {pos}'
+            yield (best[0], pos, best[1])
+            pos = best[1] if best[1] > pos else pos + 1
+
+def finditer(automata, text, overlapping: bool=False):
+    """matches of one or more dfa/nfa/eps_nfa patterns in text, see scanner.finditer"""
+    return scanner(automata).finditer(text, overlapping)
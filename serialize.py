@@ -0,0 +1,266 @@
+import io
+import json
+import re
+import numpy as np
+from contextlib import nullcontext
+from dfa import dfa
+from nfa import nfa, eps_nfa
+from cfg import CFG
+from compiled import compiled_dfa, compiled_nfa
+from symbolic import char_class
+
+# Binary format, version 1:
+#   magic b'AUTOLIB\0', format version (uint32 LE), header length (uint32 LE), JSON header, padding
+#   then the arrays, each at a 64-byte aligned offset from the start of the file
+# The header holds the kind of object, its name, the interned state/symbol tables and the offset, dtype and shape of
+# every array, so loading maps the arrays straight from the file with numpy.memmap.
+#   dfa:     full  int32 (|Q|+1, |A|+1) transitions as in compiled_dfa (start state 0, dead state |Q|), final bool (|Q|+1)
+#   nfa:     indptr/indices successor lists in CSR layout as in compiled_nfa.to_csr, start/final int32 state indices
+#   eps_nfa: as nfa, with eps among the symbols
+#   CFG:     lhs int32 (|P|), rhs_ptr int32 (|P|+1) into rhs int32 symbol indices, rhs_str uint8 (1 for string rhs)
+
+magic = b'AUTOLIB\x00'
+version = 1
+
+def encode_label(x):
+    # JSON form of a state/symbol label; tuples, (frozen)sets and char_classes are tagged, since JSON has only lists
+    if x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    if isinstance(x, char_class):
+        return {'char_class': [list(r) for r in x.ranges]}
+    if isinstance(x, tuple):
+        return {'tuple': [encode_label(y) for y in x]}
+    if isinstance(x, (set, frozenset)):
+        return {'frozenset': [encode_label(y) for y in x]}
+    raise TypeError(f'cannot serialize label {x!r} of type {type(x).__name__}')
+
+def decode_label(x):
+    if isinstance(x, dict):
+        if 'tuple' in x: return tuple(decode_label(y) for y in x['tuple'])
+        if 'char_class' in x: return char_class(tuple(r) for r in x['char_class'])
+        return frozenset(decode_label(y) for y in x['frozenset'])
+    return x
+
+def write(path, header: dict, arrays: dict):
+    # path is a file name or a seekable binary file
+    layout = {}
+    header = dict(header, version=version, arrays=layout)
+    # the offsets depend on the header length, which depends on the offsets: reserve room and fix up
+    offset = 0
+    for key, arr in arrays.items():
+        layout[key] = [offset, arr.dtype.str, list(arr.shape)]
+        offset += (arr.nbytes + 63) // 64 * 64
+    base = (len(magic) + 8 + len(json.dumps(header).encode()) + 64 * (len(arrays) + 1) + 63) // 64 * 64
+    for key in layout:
+        layout[key][0] += base
+    data = json.dumps(header).encode()
+    assert len(magic) + 8 + len(data) <= base, 'header does not fit'
+    with (open(path, 'wb') if isinstance(path, str) else nullcontext(path)) as f:
+        f.write(magic)
+        f.write(np.array([version, len(data)], dtype='<u4').tobytes())
+        f.write(data)
+        for key, arr in arrays.items():
+            f.seek(layout[key][0])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        end = f.seek(0, io.SEEK_END)
+        f.write(bytes(base + offset - end))
+
+def read(path: str, mmap: bool=True):
+    with open(path, 'rb') as f:
+        head = f.read(len(magic) + 8)
+        assert head[:len(magic)] == magic, f'{path} is not an automaton file'
+        file_version, length = np.frombuffer(head[len(magic):], dtype='<u4')
+        assert file_version <= version, f'{path} has format version {file_version}, newer than {version}'
+        header = json.loads(f.read(int(length)))
+    arrays = {}
+    for key, (offset, dtype, shape) in header['arrays'].items():
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+        else:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                arrays[key] = np.frombuffer(f.read(int(np.prod(shape)) * np.dtype(dtype).itemsize), dtype=dtype).reshape(shape)
+    return header, arrays
+
+def read_bytes(data: bytes):
+    # as read, from the contents of a file; the arrays are views of data
+    assert data[:len(magic)] == magic, 'not an automaton file'
+    file_version, length = np.frombuffer(data[len(magic):len(magic) + 8], dtype='<u4')
+    assert file_version <= version, f'format version {file_version}, newer than {version}'
+    header = json.loads(data[len(magic) + 8:len(magic) + 8 + int(length)])
+    arrays = {key: np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+              for key, (offset, dtype, shape) in header['arrays'].items()}
+    return header, arrays
+
+def dumps(obj) -> bytes:
+    """the bytes save would write for obj"""
+    f = io.BytesIO()
+    save(obj, f)
+    return f.getvalue()
+
+def loads(data: bytes):
+    """the dfa, nfa, eps_nfa or CFG whose saved bytes are data"""
+    return build(*read_bytes(data))
+
+def save(obj, path):
+    """write a dfa, nfa, eps_nfa or CFG to path (a file name or a seekable binary file) in the binary format above"""
+    if isinstance(obj, CFG):
+        symbols = list(set(obj.N) | set(obj.A) | set(X for rhss in obj.P.values() for rhs in rhss for X in rhs) | set(obj.P))
+        index = {X: i for i, X in enumerate(symbols)}
+        lhs, rhs_ptr, rhs, rhs_str = [], [0], [], []
+        for A, rhss in obj.P.items():
+            for r in rhss:
+                lhs.append(index[A])
+                # a string rhs is stored character by character ('ϵ' included) and joined back on load
+                rhs.extend(index[X] for X in (tuple(r) if isinstance(r, str) else r))
+                rhs_ptr.append(len(rhs))
+                rhs_str.append(isinstance(r, str))
+        header = {'kind': 'CFG', 'symbols': [encode_label(X) for X in symbols], 'N': [index[X] for X in obj.N],
+                  'A': [index[X] for X in obj.A], 'S': index[obj.S], 'lhs_only': [index[A] for A, rhss in obj.P.items() if not rhss]}
+        arrays = {'lhs': np.array(lhs, dtype=np.int32), 'rhs_ptr': np.array(rhs_ptr, dtype=np.int32),
+                  'rhs': np.array(rhs, dtype=np.int32), 'rhs_str': np.array(rhs_str, dtype=np.uint8)}
+        return write(path, header, arrays)
+    if isinstance(obj, dfa):
+        C = obj.compile()
+        header = {'kind': 'dfa', 'name': obj.name, 'states': [encode_label(q) for q in C.states], 'symbols': [encode_label(a) for a in C.symbols]}
+        return write(path, header, {'full': C.full, 'final': C.final})
+    assert isinstance(obj, nfa), f'cannot save {type(obj).__name__}'
+    C = compiled_nfa(obj.Q, obj.A, obj.Q_0, obj.F, obj.delta, method='bitset')
+    header = {'kind': 'eps_nfa' if isinstance(obj, eps_nfa) else 'nfa', 'name': obj.name,
+              'states': [encode_label(q) for q in C.states], 'symbols': [encode_label(a) for a in C.symbols]}
+    return write(path, header, C.to_csr())
+
+def load_compiled(path: str):
+    """compiled_dfa (over memory-mapped tables, without copying them) or compiled_nfa saved at path; eps_nfa files
+    give the automaton with eps as an ordinary symbol, so compile the loaded eps_nfa instead"""
+    return build_compiled(*read(path))
+
+def loads_compiled(data: bytes):
+    """as load_compiled, from saved bytes"""
+    return build_compiled(*read_bytes(data))
+
+def build_compiled(header: dict, arrays: dict):
+    states = [decode_label(q) for q in header['states']]
+    symbols = [decode_label(a) for a in header['symbols']]
+    if header['kind'] == 'dfa':
+        return compiled_dfa.from_tables(symbols, arrays['full'], arrays['final'], states)
+    assert header['kind'] == 'nfa', f'saved {header["kind"]} is not a dfa or nfa'
+    return compiled_nfa.from_csr(symbols, len(states), arrays['indptr'], arrays['indices'], arrays['start'], arrays['final'], states)
+
+def load(path: str, mmap: bool=True):
+    """the dfa, nfa, eps_nfa or CFG saved at path. The delta of a dfa is filled from the saved table one symbol at a
+    time with numpy, but interning the states still takes O(|Q|) Python work and an nfa is rebuilt edge by edge
+    (O(|delta|)); for matching only, load_compiled maps the tables without copying them."""
+    return build(*read(path, mmap))
+
+def build(header: dict, arrays: dict):
+    kind = header['kind']
+    if kind == 'CFG':
+        symbols = [decode_label(X) for X in header['symbols']]
+        G = CFG(set(symbols[i] for i in header['N']), set(symbols[i] for i in header['A']), symbols[header['S']])
+        lhs, rhs_ptr, rhs, rhs_str = (arrays[key].tolist() for key in ('lhs', 'rhs_ptr', 'rhs', 'rhs_str'))
+        for p, A in enumerate(lhs):
+            r = tuple(symbols[X] for X in rhs[rhs_ptr[p]:rhs_ptr[p + 1]])
+            G.add_production(symbols[A], ''.join(r) if rhs_str[p] else r)
+        for A in header['lhs_only']:
+            G.P[symbols[A]] = set()
+        return G
+    states = [decode_label(q) for q in header['states']]
+    symbols = [decode_label(a) for a in header['symbols']]
+    if kind == 'dfa':
+        full, final = arrays['full'], arrays['final']
+        n, k = len(states), len(symbols)
+        M = dfa(set(states), set(symbols), states[0], set(q for q, f in zip(states, final.tolist()) if f), name=header['name'])
+        # the rows of M.delta straight from the table, one numpy pass per symbol: saved state i is M's state id
+        # ids[i], and the dead state n is -1, a missing transition
+        ids = np.array([M.states.ids[q] for q in states] + [-1], dtype=np.int32)
+        for a in range(k):
+            row = np.full(n, -1, dtype=np.int32)
+            row[ids[:n]] = ids[full[:n, a]]
+            M.delta.set_row(symbols[a], row)
+        return M
+    n = len(states)
+    indptr, indices = arrays['indptr'].tolist(), arrays['indices'].tolist()
+    cls = eps_nfa if kind == 'eps_nfa' else nfa
+    M = cls(set(states), set(symbols), set(states[i] for i in arrays['start'].tolist()), set(states[i] for i in arrays['final'].tolist()), name=header['name'])
+    for a, symbol in enumerate(symbols):
+        for i in range(n):
+            lo, hi = indptr[a * n + i], indptr[a * n + i + 1]
+            if hi > lo: M.delta[(states[i], symbol)] = set(states[j] for j in indices[lo:hi])
+    return M
+
+dot_token = re.compile(r'"((?:[^"\\]|\\.)*)"|(->|--|[{}\[\]=;,])|([^\s"{}\[\]=;,]+)')
+
+def dot_tokens(text: str):
+    for m in dot_token.finditer(text):
+        if m.group(1) is not None:
+            yield ('id', re.sub(r'\\(.)', r'\1', m.group(1)))
+        elif m.group(2) is not None:
+            yield ('op', m.group(2))
+        else:
+            yield ('id', m.group(3))
+
+def load_dot(path: str, kind: str|None=None):
+    """automaton from a Graphviz file written by draw() (not a compact drawing): red nodes are start states,
+    doublecircle nodes final states, edge labels are symbols. kind is 'dfa', 'nfa' or 'eps_nfa'; by default an eps_nfa if some edge is labelled eps,
+    a dfa if there is one start state and no state has two edges with the same label, and an nfa otherwise."""
+    with open(path, encoding='utf-8') as f:
+        tokens = list(dot_tokens(f.read()))
+    name = None
+    nodes: dict = {}
+    edges = []
+    i = 0
+    # skip "digraph name {"
+    while tokens[i] != ('op', '{'):
+        if tokens[i][0] == 'id' and tokens[i][1] not in ('digraph', 'graph', 'strict'): name = tokens[i][1]
+        i += 1
+    i += 1
+    while i < len(tokens) and tokens[i] != ('op', '}'):
+        if tokens[i][0] != 'id' or tokens[i][1] in ('graph', 'node', 'edge'):
+            # attribute statements and separators carry nothing we need
+            if tokens[i][1] in ('graph', 'node', 'edge') and i + 1 < len(tokens) and tokens[i + 1] == ('op', '['):
+                i += 1
+                while tokens[i] != ('op', ']'): i += 1
+            i += 1
+            continue
+        ids = [tokens[i][1]]
+        i += 1
+        while i < len(tokens) and tokens[i][1] in ('->', '--'):
+            ids.append(tokens[i + 1][1])
+            i += 2
+        attrs = {}
+        if i < len(tokens) and tokens[i] == ('op', '['):
+            i += 1
+            while tokens[i] != ('op', ']'):
+                if tokens[i][0] == 'id' and i + 2 < len(tokens) and tokens[i + 1] == ('op', '='):
+                    attrs[tokens[i][1]] = tokens[i + 2][1]
+                    i += 3
+                else:
+                    i += 1
+            i += 1
+        for q in ids:
+            nodes.setdefault(q, {})
+        if len(ids) == 1:
+            nodes[ids[0]].update(attrs)
+        for q1, q2 in zip(ids, ids[1:]):
+            edges.append((q1, q2, attrs.get('label', '')))
+    Q = set(nodes)
+    Q_0 = set(q for q, attrs in nodes.items() if attrs.get('color') == 'red')
+    F = set(q for q, attrs in nodes.items() if attrs.get('shape') == 'doublecircle')
+    A = set(a for _, _, a in edges)
+    if kind is None:
+        targets: dict = {}
+        for q1, q2, a in edges:
+            targets.setdefault((q1, a), set()).add(q2)
+        if eps_nfa.eps in A: kind = 'eps_nfa'
+        elif len(Q_0) == 1 and all(len(q2s) == 1 for q2s in targets.values()): kind = 'dfa'
+        else: kind = 'nfa'
+    name = name if name else 'automaton'
+    if kind == 'dfa':
+        assert len(Q_0) == 1, f'a dfa needs exactly one start state, {path} has {Q_0}'
+        M = dfa(Q, A, next(iter(Q_0)), F, name=name)
+    else:
+        M = (eps_nfa if kind == 'eps_nfa' else nfa)(Q, A - set([eps_nfa.eps]), Q_0, F, name=name)
+    for q1, q2, a in edges:
+        M.add_edge(q1, q2, a)
+    return M
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import serialize
+from dfa import dfa
+from cfg import CFG
+from compiled import compiled_dfa
+
+# An asyncio front end. Models (dfa, nfa, eps_nfa or CFG) are registered as their saved bytes (serialize.dumps)
+# and named by the sha256 of those bytes, so registering the same model twice gives the same id. The registry keeps
+# the bytes of every model and a matcher for it, least recently used first; past the memory budget the oldest models
+# are evicted, and their ids raise KeyError until they are registered again. Constructions run in a process pool,
+# to which models travel as bytes, identical concurrent requests share one computation, and the accepts calls on a
+# model within batch_window seconds are answered as one batch.
+
+def _work(op: str, data: bytes, args: tuple):
+    # in a worker process: the model comes in as bytes, and a constructed model goes back as bytes
+    M = serialize.loads(data)
+    if op == 'to_dfa': return serialize.dumps(M.to_dfa(*args))
+    if op == 'minimize': return serialize.dumps((M if isinstance(M, dfa) else M.to_dfa()).minimize())
+    if op == 'minimal_dfa': return serialize.dumps(M.minimal_dfa(*args))
+    if op == 'cyk': return M.cyk(*args)
+    if op == 'accepts': return [M.accepts(w) for w in args[0]]
+    raise ValueError(f'unknown operation {op}')
+
+def _matcher(data: bytes) -> tuple:
+    # what batches of accepts run on, and the bytes it is counted for: the compiled dfa is a view of data, so a dfa
+    # counts as its bytes; other matchers are built from it and count twice
+    header, arrays = serialize.read_bytes(data)
+    kind = header['kind']
+    if kind == 'dfa':
+        symbols = [serialize.decode_label(a) for a in header['symbols']]
+        return compiled_dfa.from_tables(symbols, arrays['full'], arrays['final'], rows=False), len(data)
+    if kind == 'nfa':
+        return serialize.build_compiled(header, arrays), 2 * len(data)
+    M = serialize.build(header, arrays)
+    return (M.compile() if kind == 'eps_nfa' else M), 2 * len(data)
+
+class AutomatonService:
+    """registry of models with async constructions and batched acceptance; use as `async with AutomatonService() as svc`"""
+    def __init__(self, memory_budget: int=256 * 2 ** 20, workers: int|None=None, batch_window: float=0.002,
+                 max_batch: int=4096, offload_length: int=256) -> None:
+        # memory_budget in bytes; workers processes in the pool (by default one per cpu); accepts calls are held
+        # at most batch_window seconds, or until max_batch of them are waiting; cyk runs in the pool on words of
+        # at least offload_length symbols, and in the event loop on shorter ones
+        self.memory_budget = memory_budget
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.offload_length = offload_length
+        self.models: OrderedDict = OrderedDict()    # id -> (bytes, matcher, counted bytes)
+        self.nbytes = 0
+        self.pending: dict = {}                     # request -> future of its result, while it runs
+        self.derived: dict = {}                     # construction request -> id of the model it built
+        self.batches: dict = {}                     # id -> (matcher, bytes, [(word, future)], flush timer)
+        self.pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await asyncio.to_thread(pool.shutdown)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self.pool is None: self.pool = ProcessPoolExecutor(self.workers)
+        return self.pool
+
+    async def _in_pool(self, op: str, data: bytes, args: tuple):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), _work, op, data, args)
+
+    def _entry(self, model_id: str) -> tuple:
+        entry = self.models.get(model_id)
+        if entry is None: raise KeyError(f'no model {model_id} (never registered, or evicted)')
+        self.models.move_to_end(model_id)
+        return entry
+
+    async def register(self, M) -> str:
+        """id of the dfa, nfa, eps_nfa or CFG M, registering it if needed"""
+        return await self.register_bytes(await asyncio.to_thread(serialize.dumps, M))
+
+    async def register_bytes(self, data: bytes) -> str:
+        """as register, for a model given as the bytes serialize.save writes"""
+        model_id = hashlib.sha256(data).hexdigest()
+        if model_id in self.models:
+            self.models.move_to_end(model_id)
+            return model_id
+        matcher, nbytes = await asyncio.to_thread(_matcher, data)
+        if model_id not in self.models:
+            self.models[model_id] = (data, matcher, nbytes)
+            self.nbytes += nbytes
+        # evict least recently used models, never the one just registered
+        while self.nbytes > self.memory_budget and len(self.models) > 1:
+            _, (_, _, n) = self.models.popitem(last=False)
+            self.nbytes -= n
+        return model_id
+
+    async def get(self, model_id: str):
+        """the model registered as model_id, loaded afresh"""
+        return await asyncio.to_thread(serialize.loads, self._entry(model_id)[0])
+
+    async def _coalesced(self, key: tuple, make):
+        # one computation per request at a time: identical requests made while it runs await the same future, which
+        # is shielded, so a caller giving up does not cancel it for the others
+        future = self.pending.get(key)
+        if future is None:
+            future = self.pending[key] = asyncio.ensure_future(make())
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _construct(self, op: str, model_id: str, *args) -> str:
+        key = (op, model_id, args)
+        built = self.derived.get(key)
+        if built in self.models:
+            self.models.move_to_end(built)
+            return built
+        data = self._entry(model_id)[0]
+        async def make():
+            built = await self.register_bytes(await self._in_pool(op, data, args))
+            self.derived[key] = built
+            return built
+        return await self._coalesced(key, make)
+
+    async def to_dfa(self, model_id: str, max_states: int|None=None) -> str:
+        """id of the subset construction of an nfa model"""
+        return await self._construct('to_dfa', model_id, max_states)
+
+    async def minimize(self, model_id: str) -> str:
+        """id of the minimized dfa of a dfa model (or of the subset construction of an nfa model)"""
+        return await self._construct('minimize', model_id)
+
+    async def minimal_dfa(self, model_id: str, strategy: str='auto') -> str:
+        """id of nfa.minimal_dfa of an nfa model"""
+        return await self._construct('minimal_dfa', model_id, strategy)
+
+    async def cyk(self, model_id: str, word: str) -> bool:
+        data, G, _ = self._entry(model_id)
+        assert isinstance(G, CFG), f'model {model_id} is not a grammar'
+        if len(word) < self.offload_length: return G.cyk(word)
+        return await self._coalesced(('cyk', model_id, word), lambda: self._in_pool('cyk', data, (word,)))
+
+    async def accepts(self, model_id: str, word) -> bool:
+        """whether the model accepts word; calls within batch_window of each other are answered in one batch"""
+        data, matcher, _ = self._entry(model_id)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.batches.get(model_id)
+        if batch is None:
+            batch = self.batches[model_id] = (matcher, data, [], loop.call_later(self.batch_window, self._flush, model_id))
+        batch[2].append((word, future))
+        if len(batch[2]) >= self.max_batch: self._flush(model_id)
+        return await future
+
+    def _flush(self, model_id: str):
+        batch = self.batches.pop(model_id, None)
+        if batch is None: return
+        matcher, data, waiting, timer = batch
+        # flushed early (full batch): the timer must not flush the next batch of this model before its window is up
+        timer.cancel()
+        words = [w for w, _ in waiting]
+        if isinstance(matcher, CFG):
+            # parsing is heavy: the batch goes to the pool
+            task = asyncio.ensure_future(self._in_pool('accepts', data, (words,)))
+            def done(task):
+                if task.cancelled():
+                    for _, future in waiting:
+                        future.cancel()
+                    return
+                _resolve(waiting, task.exception(), None if task.exception() else task.result())
+            task.add_done_callback(done)
+            return
+        try:
+            results = matcher.accepts_many(words).tolist() if isinstance(matcher, compiled_dfa) else [matcher.accepts(w) for w in words]
+        except Exception as e:
+            _resolve(waiting, e, None)
+            return
+        _resolve(waiting, None, results)
+
+def _resolve(waiting: list, error: BaseException|None, results: list|None):
+    for i, (_, future) in enumerate(waiting):
+        if future.done(): continue
+        if error is not None: future.set_exception(error)
+        else: future.set_result(results[i])
@@ -0,0 +1,243 @@
+from bisect import bisect_right
+import numpy as np
+from automaton import dfa_delta
+
+# Symbolic alphabets. A char_class is a set of characters kept as code point intervals, and is hashable, so it can be
+# a symbol of an automaton like any other: an automaton whose symbols are disjoint char_classes reads a character
+# through the class it is in. Every construction then iterates over the classes, not the characters, so an automaton
+# over all of Unicode costs what one over a handful of symbols does.
+# - partition(classes) splits a set of possibly overlapping classes (the character classes of a regex, or the
+#   symbols of several automata) into the coarsest disjoint blocks each of them is a union of;
+# - compress_alphabet(M) merges the symbols M cannot tell apart (equal transitions from every state) into one class;
+# - refine and align move automata over different partitions onto a common one, for products;
+# - classifier maps characters to the classes of an alphabet, through a binary search over interval starts, which
+#   the compiled matchers also use (vectorized, and as a 256-entry table for bytes).
+
+unicode_end = 0x110000
+
+class char_class:
+    """set of characters as sorted, disjoint, non-adjacent intervals (lo, hi) of code points, hi included"""
+    __slots__ = ('ranges', '_hash')
+
+    def __init__(self, ranges=()) -> None:
+        merged = []
+        for lo, hi in sorted(ranges):
+            assert 0 <= lo <= hi < unicode_end, f'bad code point interval ({lo}, {hi})'
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]: merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self.ranges = tuple(merged)
+        self._hash = hash(self.ranges)
+
+    @classmethod
+    def of(cls, chars) -> 'char_class':
+        """class of the given characters"""
+        return cls((ord(c), ord(c)) for c in chars)
+
+    @classmethod
+    def span(cls, lo: str, hi: str) -> 'char_class':
+        """class of the characters lo to hi"""
+        return cls([(ord(lo), ord(hi))])
+
+    @property
+    def first(self) -> str:
+        return chr(self.ranges[0][0])
+
+    def __contains__(self, c) -> bool:
+        if not isinstance(c, str) or len(c) != 1: return False
+        o = ord(c)
+        i = bisect_right(self.ranges, (o, unicode_end)) - 1
+        return i >= 0 and self.ranges[i][1] >= o
+
+    def __iter__(self):
+        # all the characters, which for large classes is a lot of them
+        for lo, hi in self.ranges:
+            for o in range(lo, hi + 1): yield chr(o)
+
+    def __len__(self) -> int:
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+
+    def __bool__(self) -> bool:
+        return bool(self.ranges)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, char_class) and self.ranges == other.ranges
+
+    def __lt__(self, other) -> bool:
+        return self.ranges < other.ranges
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __or__(self, other: 'char_class') -> 'char_class':
+        return char_class(self.ranges + other.ranges)
+
+    def __invert__(self) -> 'char_class':
+        gaps, lo = [], 0
+        for a, b in self.ranges:
+            if a > lo: gaps.append((lo, a - 1))
+            lo = b + 1
+        if lo < unicode_end: gaps.append((lo, unicode_end - 1))
+        return char_class(gaps)
+
+    def __and__(self, other: 'char_class') -> 'char_class':
+        out, i, j = [], 0, 0
+        a, b = self.ranges, other.ranges
+        while i < len(a) and j < len(b):
+            lo, hi = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+            if lo <= hi: out.append((lo, hi))
+            if a[i][1] < b[j][1]: i += 1
+            else: j += 1
+        return char_class(out)
+
+    def __sub__(self, other: 'char_class') -> 'char_class':
+        return self & ~other
+
+    def __repr__(self) -> str:
+        def show(o: int) -> str:
+            c = chr(o)
+            if c in '\\]-^': return '\\' + c
+            return c if c.isprintable() and not c.isspace() else f'\\u{{{o:x}}}'
+        parts = [show(lo) if lo == hi else show(lo) + ('' if hi == lo + 1 else '-') + show(hi) for lo, hi in self.ranges]
+        return '[' + ''.join(parts) + ']'
+
+everything = char_class([(0, unicode_end - 1)])
+
+def partition(classes) -> list:
+    """the coarsest list of disjoint, non-empty char_classes such that each of the classes is a union of some of them;
+    their union is that of the classes. One sweep over the interval ends, tracking which classes are open as a
+    bitmask; the stretches between two ends with the same mask make up one block."""
+    ends = []
+    for i, c in enumerate(set(classes)):
+        for lo, hi in c.ranges:
+            ends.append((lo, i))
+            ends.append((hi + 1, i))
+    ends.sort()
+    blocks: dict = {}
+    mask, k = 0, 0
+    while k < len(ends):
+        at = ends[k][0]
+        while k < len(ends) and ends[k][0] == at:
+            mask ^= 1 << ends[k][1]
+            k += 1
+        if mask and k < len(ends): blocks.setdefault(mask, []).append((at, ends[k][0] - 1))
+    return sorted(char_class(r) for r in blocks.values())
+
+class classifier:
+    """index in symbols of the char_class each character is in (-1 if none), for an alphabet whose char_classes are
+    disjoint; the other symbols of the alphabet (such as eps) are left out"""
+    __slots__ = ('symbols', 'starts', 'index', 'memo')
+
+    def __init__(self, symbols: list) -> None:
+        self.symbols = list(symbols)
+        cuts = sorted((lo, hi, i) for i, a in enumerate(self.symbols) if isinstance(a, char_class) for lo, hi in a.ranges)
+        # the code points from starts[j] up to starts[j + 1] are in symbols[index[j]]
+        starts, index = [0], [-1]
+        for lo, hi, i in cuts:
+            assert lo >= starts[-1], f'the char_classes {self.symbols[index[-1]]} and {self.symbols[i]} overlap'
+            if lo == starts[-1]: index[-1] = i
+            else:
+                starts.append(lo)
+                index.append(i)
+            starts.append(hi + 1)
+            index.append(-1)
+        self.starts, self.index = starts, index
+        # character -> index, for the characters looked up so far
+        self.memo = {}
+
+    @classmethod
+    def of(cls, symbols) -> 'classifier|None':
+        """classifier of the symbols, or None if none of them is a char_class"""
+        symbols = list(symbols)
+        return cls(symbols) if any(isinstance(a, char_class) for a in symbols) else None
+
+    def find(self, c) -> int:
+        i = self.memo.get(c)
+        if i is None:
+            i = self.index[bisect_right(self.starts, ord(c)) - 1] if isinstance(c, str) and len(c) == 1 else -1
+            self.memo[c] = i
+        return i
+
+    def indices(self, word, missing: int=-1) -> list:
+        """index of the class of every character of word, missing for those in none"""
+        memo, find = self.memo, self.find
+        out = []
+        for c in word:
+            i = memo.get(c)
+            if i is None: i = find(c)
+            out.append(i if i >= 0 else missing)
+        return out
+
+    def classify(self, word) -> list:
+        """the class of every character of word, None for those in none"""
+        symbols = self.symbols
+        return [symbols[i] if i >= 0 else None for i in self.indices(word)]
+
+    def byte_table(self, missing: int=-1) -> np.ndarray:
+        """256 entries: the index of the class of each byte value, read as a code point"""
+        return np.array([i if i >= 0 else missing for i in (self.find(chr(b)) for b in range(256))], dtype=np.int32)
+
+    def code_table(self, missing: int=-1) -> tuple:
+        """(interval starts, class index of each interval), both arrays, for a vectorized search over code points"""
+        return (np.array(self.starts, dtype=np.uint32),
+                np.array([i if i >= 0 else missing for i in self.index], dtype=np.int32))
+
+def _classes(M) -> dict:
+    # the symbols of M that stand for characters (single characters and char_classes, but not eps), as classes
+    eps = getattr(M, 'eps', None)
+    out = {}
+    for a in M.A:
+        if isinstance(a, char_class): out[a] = a
+        elif isinstance(a, str) and len(a) == 1 and a != eps: out[a] = char_class.of(a)
+    return out
+
+def _rebuilt(M, symbols: dict):
+    # copy of M whose transitions on a are on each of symbols[a] instead (and on a itself, if a is not in symbols)
+    A = set()
+    for a in M.A:
+        A.update(symbols.get(a, [a]))
+    if isinstance(M.delta, dfa_delta):
+        R = type(M)(set(M.Q), A, M.Q_0, set(M.F), name=M.name)
+        for (q, a), t in M.delta.items():
+            for b in symbols.get(a, [a]): R.delta[(q, b)] = t
+        return R
+    R = type(M)(set(M.Q), A, set(M.Q_0), set(M.F), name=M.name)
+    for (q, a), ts in M.delta.items():
+        for b in symbols.get(a, [a]):
+            for t in ts: R.add_edge(q, t, b)
+    return R
+
+def compress_alphabet(M):
+    """copy of the dfa or nfa M over the coarsest alphabet it cannot tell apart from its own: characters and
+    char_classes with the same transitions from every state are merged into one char_class. Other symbols (eps,
+    multi-character strings) are kept as they are."""
+    classes = _classes(M)
+    columns = {a: set() for a in classes}
+    deterministic = isinstance(M.delta, dfa_delta)
+    for (q, a), t in M.delta.items():
+        if a in columns: columns[a].add((q, t) if deterministic else (q, frozenset(t)))
+    groups: dict = {}
+    for a, column in columns.items():
+        groups.setdefault(frozenset(column), []).append(a)
+    merged = {}
+    for group in groups.values():
+        c = char_class(r for a in group for r in classes[a].ranges)
+        for a in group: merged[a] = [c]
+    R = _rebuilt(M, merged)
+    R.name = M.name + '.compressed'
+    return R
+
+def refine(M, blocks: list):
+    """copy of M over the alphabet blocks, a partition of which each of the char_class (or single character) symbols
+    of M is a union: a transition on a symbol becomes one on each block inside it"""
+    # each block lies inside a class or outside of it, so its first character tells which
+    inside = {a: [b for b in blocks if b.first in c] for a, c in _classes(M).items()}
+    R = _rebuilt(M, inside)
+    R.A.update(blocks)
+    return R
+
+def align(automata: list) -> list:
+    """the automata, each over the same partition of their char_class (or single character) symbols (see refine)"""
+    blocks = partition(c for M in automata for c in _classes(M).values())
+    return [refine(M, blocks) for M in automata]